@@ -0,0 +1,67 @@
+"""MobileNetV2 encoder-decoder lesion segmentation on ISIC 2016.
+
+Submodules are imported on first attribute access, so `import segmentation_model` does not
+import torch, and an inference worker only pays for the modules it actually uses.
+"""
+
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    'ISICDataset': 'data',
+    'PackedISICDataset': 'data',
+    'PairedBatchAugment': 'data',
+    'build_transform': 'data',
+    'normalize_batch': 'data',
+    'normalize_images': 'data',
+    'pack_isic_shards': 'data',
+    'DatasetManifest': 'manifest',
+    'PackMasks': 'mask_codec',
+    'pack_masks': 'mask_codec',
+    'unpack_masks': 'mask_codec',
+    'rle_encode': 'mask_codec',
+    'rle_decode': 'mask_codec',
+    'ConfigurableDecoder': 'models',
+    'DECODER_VARIANTS': 'models',
+    'EncoderDecoder': 'models',
+    'MobileNetDecoder': 'models',
+    'build_decoder': 'models',
+    'build_encoder_decoder': 'models',
+    'SegmentationMetrics': 'metrics',
+    'EXECUTION_MODES': 'trainer',
+    'MobileNetTrainer': 'trainer',
+    'progressive_resolution': 'trainer',
+    'CachedFeatureDataset': 'feature_cache',
+    'EncoderFeatureCache': 'feature_cache',
+    'StepProfiler': 'profiling',
+    'DecoderSweepTrainer': 'sweep',
+    'CheckpointManager': 'checkpointing',
+    'ResumableRandomSampler': 'checkpointing',
+    'make_resumable_loader': 'checkpointing',
+    'INPUT_PIPELINES': 'input_pipeline',
+    'loader_kwargs': 'input_pipeline',
+    'TrainingControl': 'training_control',
+    'TTA_CONFIGS': 'tta',
+    'TestTimeAugmentation': 'tta',
+    'MultiModelEvaluator': 'evaluation',
+    'run_directory_inference': 'inference',
+    'tiled_predict': 'inference',
+    'quantization_report': 'quantization',
+    'quantize_encoder_decoder': 'quantization',
+    'export_inference_graph': 'export',
+    'fold_batchnorm': 'export',
+    'run_distributed': 'distributed',
+    'VisualizationSink': 'visualization',
+    'device': 'devices'
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -0,0 +1,453 @@
+"""Benchmarks comparing execution modes, decoder variants, test-time augmentation, activation
+checkpointing, progressive-resolution training, input pipelines and import latency."""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+from .data import normalize_batch
+from .devices import device
+from .input_pipeline import INPUT_PIPELINES, loader_kwargs, resolve_pipeline
+from .metrics import SegmentationMetrics
+from .models import DECODER_VARIANTS, build_decoder, count_conv_flops
+from .sweep import DecoderSweepTrainer
+from .trainer import EXECUTION_MODES, MobileNetTrainer, progressive_resolution
+from .tta import TTA_CONFIGS, build_tta
+
+def benchmark_execution_modes(build_model, train_loader, val_loader, modes=None, epochs=1, tolerance=0.02, seed=0, **trainer_kwargs):
+    """
+    Trains a fresh model per execution mode and compares throughput and validation metrics.
+
+    Args:
+        build_model (callable): Returns a new, identically initialized EncoderDecoder.
+        train_loader (DataLoader): Training batches.
+        val_loader (DataLoader): Validation batches used for the accuracy check.
+        modes (list, optional): Names from EXECUTION_MODES; the first one is the reference.
+        epochs (int): Epochs per mode. Throughput excludes the first epoch when epochs > 1,
+            so compilation and warm-up are not counted.
+        tolerance (float): Maximum allowed absolute IoU/Dice drift from the reference mode.
+        seed (int): Seed applied before building and training each model.
+        **trainer_kwargs: Forwarded to MobileNetTrainer (e.g. batch_transform, num_classes).
+    """
+    modes = modes or list(EXECUTION_MODES)
+    results = []
+
+    for name in modes:
+        torch.manual_seed(seed)
+        trainer = MobileNetTrainer(build_model(), train_loader, val_loader=val_loader, **trainer_kwargs, **EXECUTION_MODES[name])
+        trainer.train(epochs)
+
+        measured = trainer.throughput[1:] if epochs > 1 else trainer.throughput
+        val_metrics = trainer.metric_history['val'][-1]
+        results.append({
+            'mode': name,
+            'samples_per_sec': sum(measured) / len(measured),
+            'val_iou': val_metrics['iou'],
+            'val_dice': val_metrics['dice']
+        })
+
+    reference = results[0]
+    failures = []
+    print(f"{'Mode':<28}{'Samples/s':>12}{'Val IoU':>10}{'Val Dice':>10}{'Speed-up':>10}")
+    for r in results:
+        r['iou_drift'] = abs(r['val_iou'] - reference['val_iou'])
+        r['dice_drift'] = abs(r['val_dice'] - reference['val_dice'])
+        print(f"{r['mode']:<28}{r['samples_per_sec']:>12.1f}{r['val_iou']:>10.4f}{r['val_dice']:>10.4f}{r['samples_per_sec'] / reference['samples_per_sec']:>9.2f}x")
+        if max(r['iou_drift'], r['dice_drift']) > tolerance:
+            failures.append(r['mode'])
+
+    if failures:
+        raise RuntimeError(f"IoU/Dice drifted more than {tolerance} from '{reference['mode']}' for: {', '.join(failures)}")
+    return results
+
+def benchmark_decoders(variants=None, encoder=None, train_loader=None, val_loader=None, epochs=0, image_size=128,
+                       batch_size=16, iters=50, num_classes=1, **trainer_kwargs):
+    """
+    Reports parameters, FLOPs and CPU latency of each decoder variant and, when `epochs` > 0,
+    the val IoU/Dice after training it on a frozen copy of `encoder`.
+
+    Args:
+        variants (list, optional): Names from DECODER_VARIANTS; defaults to all of them.
+        encoder (nn.Module, optional): Frozen MobileNetV2 used for the accuracy runs.
+        train_loader (DataLoader, optional): Training batches for the accuracy runs.
+        val_loader (DataLoader, optional): Validation batches for the accuracy runs.
+        epochs (int): Training epochs per variant; 0 skips the accuracy runs.
+        image_size (int): Input image size; decoder inputs are 1280 x size/32 x size/32.
+        batch_size (int): Batch size of the latency measurement.
+        iters (int): Timed iterations of the latency measurement.
+        **trainer_kwargs: Forwarded to DecoderSweepTrainer (e.g. feature_cache, batch_transform).
+    """
+    variants = variants or list(DECODER_VARIANTS)
+    feature_shape = (1280, image_size // 32, image_size // 32)
+    features = torch.randn(batch_size, *feature_shape)
+    results = []
+
+    for name in variants:
+        decoder = build_decoder(name, feature_shape[0], num_classes).eval()
+        with torch.no_grad():
+            for _ in range(5):
+                decoder(features)
+            start = time.perf_counter()
+            for _ in range(iters):
+                decoder(features)
+            latency = 1000 * (time.perf_counter() - start) / iters
+
+        results.append({
+            'decoder': name,
+            'params': sum(p.numel() for p in decoder.parameters()),
+            'mflops': count_conv_flops(decoder, feature_shape) / 1e6,
+            'latency_ms': latency,
+            'val_iou': float('nan'),
+            'val_dice': float('nan')
+        })
+
+    if epochs > 0:
+        # All variants train side by side on one encoder pass per batch
+        sweep = DecoderSweepTrainer(encoder, [{'name': name, 'decoder': name} for name in variants], train_loader,
+                                    val_loader=val_loader, num_classes=num_classes, **trainer_kwargs)
+        sweep.train(epochs)
+        for result in results:
+            result['val_iou'] = sweep.history[result['decoder']]['val'][-1]['iou']
+            result['val_dice'] = sweep.history[result['decoder']]['val'][-1]['dice']
+
+    print(f"{'Decoder':<28}{'Params':>10}{'MFLOPs':>10}{'ms/batch':>10}{'Val IoU':>10}{'Val Dice':>10}")
+    for r in results:
+        print(f"{r['decoder']:<28}{r['params']:>10,}{r['mflops']:>10.1f}{r['latency_ms']:>10.2f}{r['val_iou']:>10.4f}{r['val_dice']:>10.4f}")
+    return results
+
+def benchmark_tta(model, loader, configs=None, batch_transform=normalize_batch, num_batches=None, warmup=2):
+    """
+    Evaluates `model` on `loader` under each TTA configuration and reports throughput against IoU/Dice.
+
+    Args:
+        model (EncoderDecoder): Trained model; it is moved to `device`.
+        loader (DataLoader): Evaluation batches, e.g. the test loader.
+        configs (list, optional): Names from TTA_CONFIGS; the first one is the reference.
+        batch_transform (callable): Turns collated batches into model inputs.
+        num_batches (int, optional): Limits the number of evaluated batches.
+        warmup (int): Leading batches excluded from the timing.
+    """
+    configs = configs or list(TTA_CONFIGS)
+    model = model.to(device).eval()
+    results = []
+
+    for name in configs:
+        tta_model = build_tta(model, name)
+        metrics = SegmentationMetrics()
+        elapsed, timed_images = 0.0, 0
+        with torch.no_grad():
+            for i, (inputs, labels) in enumerate(loader):
+                if num_batches is not None and i >= num_batches:
+                    break
+                inputs, labels = batch_transform(inputs.to(device), labels.to(device))
+
+                start = time.perf_counter()
+                outputs = tta_model(inputs)
+                if device.type == 'cuda':
+                    torch.cuda.synchronize()
+                if i >= warmup:
+                    elapsed += time.perf_counter() - start
+                    timed_images += inputs.size(0)
+                metrics.update(outputs, labels)
+
+        scores = metrics.compute()
+        results.append({
+            'config': name,
+            'views': getattr(tta_model, 'num_views', 1),
+            'images_per_sec': timed_images / max(elapsed, 1e-9),
+            'iou': scores['iou'],
+            'dice': scores['dice']
+        })
+
+    reference = results[0]
+    print(f"{'TTA':<16}{'Views':>6}{'Images/s':>12}{'Rel. speed':>12}{'IoU':>10}{'Dice':>10}{'Dice gain':>11}")
+    for r in results:
+        print(f"{r['config']:<16}{r['views']:>6}{r['images_per_sec']:>12.1f}{r['images_per_sec'] / max(reference['images_per_sec'], 1e-9):>11.2f}x"
+              f"{r['iou']:>10.4f}{r['dice']:>10.4f}{r['dice'] - reference['dice']:>+11.4f}")
+    return results
+
+def _saved_activation_bytes():
+    """Context whose returned list collects the bytes autograd keeps for backward, counting each storage once."""
+    seen, total = set(), [0]
+
+    def pack(tensor):
+        key = (tensor.untyped_storage().data_ptr(), tensor.device)
+        if key not in seen:
+            seen.add(key)
+            total[0] += tensor.untyped_storage().nbytes()
+        return tensor
+
+    return torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor), total
+
+def benchmark_activation_checkpointing(build_model, loader, configs=None, effective_batch=16, steps=5, warmup=1,
+                                       batch_transform=normalize_batch, lr=0.0001):
+    """
+    Compares memory and optimizer-step time of plain and activation-checkpointed fine-tuning.
+
+    Args:
+        build_model (callable): Returns a new, identically initialized EncoderDecoder.
+        loader (DataLoader): Batches at the training resolution; `effective_batch` samples are taken once
+            and reused, so data loading is not part of the timing.
+        configs (list, optional): Dicts with 'checkpointing' (bool) and 'micro_batch' (int); each
+            optimizer step accumulates effective_batch / micro_batch micro-batches.
+        effective_batch (int): Samples per optimizer step.
+        steps (int): Timed optimizer steps per config.
+        warmup (int): Untimed optimizer steps per config.
+        batch_transform (callable): Turns collated batches into model inputs.
+        lr (float): Adam learning rate.
+    """
+    configs = configs or [
+        {'checkpointing': False, 'micro_batch': effective_batch},
+        {'checkpointing': True, 'micro_batch': effective_batch},
+        {'checkpointing': True, 'micro_batch': max(effective_batch // 4, 1)}
+    ]
+
+    images, masks, count = [], [], 0
+    for inputs, labels in loader:
+        images.append(inputs)
+        masks.append(labels)
+        count += inputs.size(0)
+        if count >= effective_batch:
+            break
+    inputs, labels = batch_transform(torch.cat(images)[:effective_batch].to(device), torch.cat(masks)[:effective_batch].to(device))
+    criterion = torch.nn.BCEWithLogitsLoss()
+    results = []
+
+    for config in configs:
+        micro_batch = config['micro_batch']
+        accumulation = -(-effective_batch // micro_batch)
+        model = build_model().to(device).set_activation_checkpointing(config['checkpointing']).train()
+        optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+        result = {'mode': ("checkpointed" if config['checkpointing'] else "plain") + f" {micro_batch}x{accumulation}",
+                  'activations_mb': float('nan'), 'peak_cuda_mb': float('nan'), 'step_ms': float('nan')}
+
+        try:
+            # Activation memory of one micro-batch forward pass, before backward frees it
+            hooks, saved = _saved_activation_bytes()
+            with hooks:
+                loss = criterion(model(inputs[:micro_batch], return_logits=True).float(), labels[:micro_batch])
+            result['activations_mb'] = saved[0] / 2 ** 20
+            loss.backward()
+            optimizer.zero_grad()
+
+            if device.type == 'cuda':
+                torch.cuda.reset_peak_memory_stats()
+            timings = []
+            for step in range(warmup + steps):
+                start = time.perf_counter()
+                optimizer.zero_grad()
+                for i in range(0, effective_batch, micro_batch):
+                    logits = model(inputs[i:i + micro_batch], return_logits=True)
+                    (criterion(logits.float(), labels[i:i + micro_batch]) / accumulation).backward()
+                optimizer.step()
+                if device.type == 'cuda':
+                    torch.cuda.synchronize()
+                if step >= warmup:
+                    timings.append(time.perf_counter() - start)
+            result['step_ms'] = 1000 * statistics.median(timings)
+            if device.type == 'cuda':
+                result['peak_cuda_mb'] = torch.cuda.max_memory_allocated() / 2 ** 20
+        except torch.cuda.OutOfMemoryError:
+            result['mode'] += " (OOM)"
+        finally:
+            del model, optimizer
+            if device.type == 'cuda':
+                torch.cuda.empty_cache()
+        results.append(result)
+
+    reference = results[0]
+    print(f"Input {tuple(inputs.shape[1:])}, {effective_batch} samples per optimizer step")
+    print(f"{'Mode':<24}{'Activations (MB)':>18}{'Peak CUDA (MB)':>16}{'Step (ms)':>11}{'Memory':>9}{'Time':>8}")
+    for r in results:
+        print(f"{r['mode']:<24}{r['activations_mb']:>18.1f}{r['peak_cuda_mb']:>16.1f}{r['step_ms']:>11.1f}"
+              f"{r['activations_mb'] / reference['activations_mb']:>8.2f}x{r['step_ms'] / reference['step_ms']:>7.2f}x")
+    return results
+
+def _ramp_sizes(final_size):
+    # Half, three quarters and full size, on the multiples of 32 the encoder-decoder accepts
+    return sorted({max(32, round(final_size * f / 32) * 32) for f in (0.5, 0.75, 1.0)})
+
+def benchmark_time_to_accuracy(build_model, loader_factory, val_loader, final_size=128, schedules=None, epochs=6,
+                               target_dice=0.8, seed=0, **trainer_kwargs):
+    """
+    Trains a fresh model per resolution schedule and reports the wall-clock time until the
+    validation Dice first reaches `target_dice`.
+
+    Args:
+        build_model (callable): Returns a new, identically initialized EncoderDecoder.
+        loader_factory (callable): Returns the training loader at a given image size. All loaders are
+            built before the first run, so one-off preprocessing such as shard packing is not timed.
+        val_loader (DataLoader): Validation batches at `final_size`; every schedule is scored on them.
+        final_size (int): Image size of the fixed-resolution reference run.
+        schedules (dict, optional): Name -> MobileNetTrainer resolution_schedule; the first one is the
+            reference. Defaults to fixed `final_size` against a ramp from half of it.
+        epochs (int): Epochs per schedule.
+        target_dice (float): Validation Dice that counts as reaching the target.
+        seed (int): Seed applied before building and training each model.
+        **trainer_kwargs: Forwarded to MobileNetTrainer (e.g. batch_transform, precision).
+    """
+    schedules = schedules or {
+        f"fixed {final_size}px": [(0, final_size)],
+        "progressive": progressive_resolution(epochs, _ramp_sizes(final_size))
+    }
+    loaders = {}
+    for schedule in schedules.values():
+        for _, size in schedule:
+            if size not in loaders:
+                loaders[size] = loader_factory(size)
+
+    results = []
+    for name, schedule in schedules.items():
+        torch.manual_seed(seed)
+        trainer = MobileNetTrainer(build_model(), loaders[schedule[0][1]], val_loader=val_loader,
+                                   resolution_schedule=schedule, loader_factory=loaders.__getitem__, **trainer_kwargs)
+        trainer.train(epochs)
+
+        control = trainer.control
+        result = {'schedule': name, 'sizes': "->".join(str(size) for _, size in sorted(schedule)),
+                  'time_to_target_s': float('nan'), 'epochs_to_target': None,
+                  'total_s': sum(control.epoch_times) + sum(control.validation_times)}
+        # Wall-clock when each validation result became available: training epochs so far plus validations so far
+        for k, record in enumerate(trainer.metric_history['val']):
+            elapsed = sum(control.epoch_times[:record['epoch'] + 1]) + sum(control.validation_times[:k + 1])
+            if record['dice'] >= target_dice:
+                result['time_to_target_s'] = elapsed
+                result['epochs_to_target'] = record['epoch'] + 1
+                break
+        dices = [record['dice'] for record in trainer.metric_history['val']]
+        result['final_dice'] = dices[-1] if dices else float('nan')
+        result['best_dice'] = max(dices) if dices else float('nan')
+        results.append(result)
+
+    reference = results[0]
+    print(f"Time to val Dice {target_dice} over {epochs} epochs")
+    print(f"{'Schedule':<20}{'Sizes':>16}{'To target (s)':>15}{'Epochs':>8}{'Best Dice':>11}{'Final Dice':>12}{'Total (s)':>11}{'Speed-up':>10}")
+    for r in results:
+        epochs_to_target = r['epochs_to_target'] if r['epochs_to_target'] is not None else "-"
+        print(f"{r['schedule']:<20}{r['sizes']:>16}{r['time_to_target_s']:>15.1f}{epochs_to_target:>8}{r['best_dice']:>11.4f}"
+              f"{r['final_dice']:>12.4f}{r['total_s']:>11.1f}{reference['time_to_target_s'] / r['time_to_target_s']:>9.2f}x")
+    return results
+
+def _repeat(loader):
+    while True:  # Later passes reuse persistent workers
+        yield from loader
+
+def benchmark_input_pipeline(dataset, batch_size=32, pipelines=None, num_batches=50, warmup=5, step_fn=None,
+                             compute_ms=0.0, batch_transform=normalize_batch):
+    """
+    Streams `dataset` through each input pipeline and reports images/s and the fraction of every
+    step spent waiting on the loader.
+
+    Args:
+        dataset (Dataset): Training samples, e.g. ISICDataset or PackedISICDataset.
+        batch_size (int): Images per batch.
+        pipelines (list, optional): INPUT_PIPELINES names or settings dicts; the first one is the reference.
+        num_batches (int): Timed batches per pipeline; the loader is restarted when the dataset runs out.
+        warmup (int): Leading batches excluded from the timing, after the worker start-up.
+        step_fn (callable, optional): Called as step_fn(inputs, labels) on the device batch to stand in
+            for the training step, e.g. a forward/backward pass.
+        compute_ms (float): Without `step_fn`, milliseconds each step sleeps to model accelerator time
+            during which the workers keep decoding.
+        batch_transform (callable, optional): Applied to the device batch before the step.
+    """
+    pipelines = pipelines or list(INPUT_PIPELINES)
+    results = []
+
+    for pipeline in pipelines:
+        settings = resolve_pipeline(pipeline)
+        loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, drop_last=True, **loader_kwargs(settings))
+        if len(loader) == 0:
+            raise ValueError(f"The dataset holds fewer than batch_size={batch_size} samples")
+        iterator = _repeat(loader)
+
+        wait, step, images = 0.0, 0.0, 0
+        start = time.perf_counter()
+        for i in range(warmup + num_batches):
+            fetch = time.perf_counter()
+            inputs, labels = next(iterator)
+            ready = time.perf_counter()
+            if i == 0:
+                first_batch_s = ready - start
+
+            inputs = inputs.to(device, non_blocking=settings['non_blocking'])
+            labels = labels.to(device, non_blocking=settings['non_blocking'])
+            if batch_transform is not None:
+                inputs, labels = batch_transform(inputs, labels)
+            if step_fn is not None:
+                step_fn(inputs, labels)
+            elif compute_ms:
+                time.sleep(compute_ms / 1000)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            done = time.perf_counter()
+
+            if i >= warmup:
+                wait += ready - fetch
+                step += done - ready
+                images += inputs.size(0)
+        del iterator, loader  # Shuts the workers down before the next pipeline starts its own
+
+        name = pipeline if isinstance(pipeline, str) else "custom"
+        results.append({
+            'pipeline': name,
+            'num_workers': settings['num_workers'],
+            'prefetch_factor': settings['prefetch_factor'] if settings['num_workers'] > 0 else None,
+            'pin_memory': settings['pin_memory'],
+            'non_blocking': settings['non_blocking'],
+            'first_batch_s': first_batch_s,
+            'images_per_sec': images / max(wait + step, 1e-9),
+            'data_wait_fraction': wait / max(wait + step, 1e-9),
+            'step_ms': 1000 * (wait + step) / num_batches
+        })
+
+    reference = results[0]
+    setup = f"{batch_size} images per batch, {num_batches} timed batches"
+    print(setup + (f", {compute_ms:g} ms simulated compute per step" if step_fn is None else ""))
+    print(f"{'Pipeline':<12}{'Workers':>8}{'Prefetch':>9}{'Pinned':>8}{'First (s)':>11}{'Step (ms)':>11}{'Images/s':>10}{'Data wait':>11}{'Speed-up':>10}")
+    for r in results:
+        prefetch = r['prefetch_factor'] if r['prefetch_factor'] is not None else "-"
+        print(f"{r['pipeline']:<12}{r['num_workers']:>8}{prefetch:>9}{'yes' if r['pin_memory'] else 'no':>8}{r['first_batch_s']:>11.2f}"
+              f"{r['step_ms']:>11.1f}{r['images_per_sec']:>10.1f}{r['data_wait_fraction']:>11.0%}"
+              f"{r['images_per_sec'] / max(reference['images_per_sec'], 1e-9):>9.2f}x")
+    return results
+
+# Modules the inference path must not pull in at import time
+HEAVY_MODULES = ('matplotlib', 'cv2', 'sklearn', 'pandas', 'seaborn', 'torch.utils.tensorboard', 'torchsummary',
+                 'google.colab', 'onnx', 'onnxruntime')
+
+def benchmark_import_time(module='segmentation_model.inference', repeats=5, budget_s=None):
+    """
+    Measures the cold import latency of `module` in fresh interpreters.
+
+    Args:
+        module (str): Module to import.
+        repeats (int): Number of fresh interpreters; the median is reported.
+        budget_s (float, optional): Raise if the median exceeds this many seconds.
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    timings, heavy = [], ""
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True).stdout.splitlines()
+        timings.append(float(out[0]))
+        heavy = out[1] if len(out) > 1 else ""
+
+    median = statistics.median(timings)
+    print(f"import {module}: median {1000 * median:.0f} ms over {repeats} cold starts (min {1000 * min(timings):.0f} ms)")
+    if heavy:
+        raise RuntimeError(f"import {module} loaded heavy modules: {heavy}")
+    if budget_s is not None and median > budget_s:
+        raise RuntimeError(f"import {module} took {median:.2f}s, over the {budget_s:.2f}s budget")
+    return median
@@ -0,0 +1,180 @@
+"""Asynchronous, resumable checkpointing.
+
+The training thread only takes a CPU copy of the state (model, optimizer, scheduler, RNG
+streams, data-loader position, running metrics and history); serialization and disk I/O
+happen on a background thread, with at most one snapshot waiting behind the one being written.
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Sampler
+
+def to_cpu(obj):
+    """Recursively copies every tensor in `obj` to the CPU."""
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+def capture_rng_state():
+    return {
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+        'numpy': np.random.get_state(),
+        'python': random.getstate()
+    }
+
+def restore_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['python'])
+
+class ResumableRandomSampler(Sampler):
+    def __init__(self, data_source, seed=0):
+        """
+        Shuffles with a permutation derived from (seed, epoch) only, so a resumed run can skip
+        straight to the sample it stopped at without loading the ones before it.
+        """
+        self.data_source = data_source
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def set_start(self, start):
+        self.start = start
+
+    def __iter__(self):
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        order = torch.randperm(len(self.data_source), generator=generator).tolist()
+        start, self.start = self.start, 0  # Only the resumed epoch starts part-way through
+        return iter(order[start:])
+
+    def __len__(self):
+        return len(self.data_source) - self.start
+
+def make_resumable_loader(dataset, batch_size, seed=0, **loader_kwargs):
+    return DataLoader(dataset, batch_size=batch_size, sampler=ResumableRandomSampler(dataset, seed=seed), **loader_kwargs)
+
+class CheckpointManager():
+    def __init__(self, directory, every_n_steps=None, every_n_epochs=1, keep_last=3, keep_best=1):
+        """
+        Args:
+            directory (str): Receives the checkpoints and the `checkpoints.json` index.
+            every_n_steps (int, optional): Also checkpoint every n optimizer steps, for mid-epoch resume.
+            every_n_epochs (int): Checkpoint after every n-th epoch.
+            keep_last (int): Most recent checkpoints to keep.
+            keep_best (int): Checkpoints with the highest val Dice to keep, on top of `keep_last`.
+        """
+        self.directory = directory
+        self.every_n_steps = every_n_steps
+        self.every_n_epochs = every_n_epochs
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.index_path = os.path.join(directory, "checkpoints.json")
+        os.makedirs(directory, exist_ok=True)
+
+        self.entries = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.entries = json.load(f)
+
+        self._error = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def should_save_step(self, global_step):
+        return self.every_n_steps is not None and global_step % self.every_n_steps == 0
+
+    def should_save_epoch(self, epoch):
+        return (epoch + 1) % self.every_n_epochs == 0
+
+    def save(self, state, metric=None):
+        """Queues a CPU snapshot for writing; blocks only while an earlier snapshot is still queued."""
+        self._raise_pending_error()
+        name = f"checkpoint_e{state['epoch']:03d}_s{state['global_step']:08d}.pt"
+        self._queue.put((name, state, metric))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, name, state, metric):
+        path = os.path.join(self.directory, name)
+        torch.save(state, path + ".tmp")
+        os.replace(path + ".tmp", path)  # Never leave a truncated checkpoint behind
+
+        with self._lock:
+            self.entries = [e for e in self.entries if e['file'] != name]
+            self.entries.append({'file': name, 'epoch': state['epoch'], 'step_in_epoch': state['step_in_epoch'],
+                                 'global_step': state['global_step'], 'metric': metric})
+            self._prune()
+            with open(self.index_path + ".tmp", 'w') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(self.index_path + ".tmp", self.index_path)
+
+    def _prune(self):
+        by_step = sorted(self.entries, key=lambda e: e['global_step'])
+        keep = {e['file'] for e in by_step[-self.keep_last:]} if self.keep_last > 0 else set()
+        scored = sorted((e for e in self.entries if e['metric'] is not None), key=lambda e: e['metric'], reverse=True)
+        keep |= {e['file'] for e in scored[:self.keep_best]}
+
+        for entry in self.entries:
+            if entry['file'] not in keep:
+                path = os.path.join(self.directory, entry['file'])
+                if os.path.exists(path):
+                    os.remove(path)
+        self.entries = [e for e in self.entries if e['file'] in keep]
+
+    def _raise_pending_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Writing a checkpoint failed") from error
+
+    def wait(self):
+        """Blocks until every queued checkpoint is on disk."""
+        self._queue.join()
+        self._raise_pending_error()
+
+    def latest(self):
+        self.wait()
+        with self._lock:
+            if not self.entries:
+                return None
+            return os.path.join(self.directory, max(self.entries, key=lambda e: e['global_step'])['file'])
+
+    def best(self):
+        self.wait()
+        with self._lock:
+            scored = [e for e in self.entries if e['metric'] is not None]
+            if not scored:
+                return None
+            return os.path.join(self.directory, max(scored, key=lambda e: e['metric'])['file'])
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_pending_error()
@@ -0,0 +1,90 @@
+"""Command-line entry point: `python -m segmentation_model <command> [options]`.
+
+Each command imports only the modules it needs.
+"""
+
+import argparse
+import importlib
+import json
+import sys
+
+def _infer(argv):
+    importlib.import_module(".inference", __package__).main(argv)
+
+def _evaluate(argv):
+    importlib.import_module(".evaluation", __package__).main(argv)
+
+def _export(argv):
+    importlib.import_module(".export", __package__).main(argv)
+
+def _train_ddp(argv):
+    parser = argparse.ArgumentParser(prog="segmentation_model train-ddp", description="Data-parallel CPU training.")
+    parser.add_argument('--config', required=True, help="JSON run config, see distributed_train_worker")
+    parser.add_argument('--nprocs', type=int, default=1, help="Processes on this node")
+    parser.add_argument('--benchmark', action='store_true', help="Run the 1..nprocs scaling benchmark instead")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        run_config = json.load(f)
+
+    distributed = importlib.import_module(".distributed", __package__)
+    if args.benchmark:
+        distributed.benchmark_ddp_scaling(run_config, max_procs=args.nprocs)
+    else:
+        distributed.run_distributed(distributed.distributed_train_worker, args.nprocs, run_config)
+
+def _bench_import(argv):
+    parser = argparse.ArgumentParser(prog="segmentation_model bench-import", description="Cold-import latency benchmark.")
+    parser.add_argument('--module', default="segmentation_model.inference")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=None, help="Fail above this median, in seconds")
+    args = parser.parse_args(argv)
+
+    importlib.import_module(".benchmarks", __package__).benchmark_import_time(args.module, args.repeats, args.budget)
+
+def _bench_loader(argv):
+    parser = argparse.ArgumentParser(prog="segmentation_model bench-loader", description="Input-pipeline throughput benchmark.")
+    parser.add_argument('--image-dir', help="ISIC images, decoded on the fly")
+    parser.add_argument('--mask-dir')
+    parser.add_argument('--shard-dir', help="Packed shards to read instead of the image directories")
+    parser.add_argument('--size', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--pipeline', action='append', help="INPUT_PIPELINES name; repeat to compare, default all")
+    parser.add_argument('--workers', type=int, action='append', help="Also run the 'pinned' pipeline with this many workers")
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--compute-ms', type=float, default=0.0, help="Simulated training-step time per batch")
+    args = parser.parse_args(argv)
+    if not args.shard_dir and not (args.image_dir and args.mask_dir):
+        parser.error("either --shard-dir or both --image-dir and --mask-dir are required")
+
+    data = importlib.import_module(".data", __package__)
+    if args.shard_dir:
+        dataset = data.PackedISICDataset(args.shard_dir)
+    else:
+        dataset = data.ISICDataset(args.image_dir, args.mask_dir, transform=data.build_transform(args.size, packed_masks=True))
+
+    input_pipeline = importlib.import_module(".input_pipeline", __package__)
+    pipelines = args.pipeline or list(input_pipeline.INPUT_PIPELINES)
+    pipelines += [dict(input_pipeline.INPUT_PIPELINES['pinned'], num_workers=n) for n in args.workers or []]
+    importlib.import_module(".benchmarks", __package__).benchmark_input_pipeline(
+        dataset, batch_size=args.batch_size, pipelines=pipelines, num_batches=args.batches, compute_ms=args.compute_ms)
+
+COMMANDS = {
+    'infer': (_infer, "Tiled inference over a directory of images"),
+    'evaluate': (_evaluate, "Score several checkpoints in one pass over a test set"),
+    'export': (_export, "Export frozen TorchScript/ONNX artifacts"),
+    'train-ddp': (_train_ddp, "Multi-process CPU data-parallel training"),
+    'bench-import': (_bench_import, "Cold-import latency of the inference path"),
+    'bench-loader': (_bench_loader, "Images/s and data-wait share of input pipelines")
+}
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print("usage: python -m segmentation_model <command> [options]\n\ncommands:")
+        for name, (_, help_text) in COMMANDS.items():
+            print(f"  {name:<14}{help_text}")
+        return 0 if argv and argv[0] in ('-h', '--help') else 2
+
+    COMMANDS[argv[0]][0](argv[1:])
+    return 0
@@ -0,0 +1,319 @@
+"""Datasets, packed shards and batched augmentation for ISIC 2016.
+
+Decoding and resampling the full-resolution ISIC files dominates an epoch on CPU nodes, so
+the resized images and masks are written once into contiguous uint8 `.npy` shards and served
+as tensor views of the memory map.
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torchvision.transforms as transforms
+from PIL import Image
+from torch.utils.data import Dataset
+
+from .manifest import DatasetManifest
+from .mask_codec import PackMasks, is_packed, pack_masks, unpack_masks
+
+class ISICDataset(Dataset):
+    def __init__(self, image_dir=None, mask_dir=None, transform=None, manifest=None):
+        """
+        Args:
+            image_dir (str): Path to the directory containing images.
+            mask_dir (str): Path to the directory containing masks.
+            transform (callable, optional): Optional transform to be applied to images and masks.
+            manifest (ManifestView, optional): Manifest, or a subset/split view of one, selecting the
+                samples. Built (or reopened) from `image_dir` and `mask_dir` when not given.
+        """
+        # Images and masks are paired by file stem; the directory listing order is arbitrary
+        self.manifest = manifest if manifest is not None else DatasetManifest(image_dir, mask_dir)
+        self.ids = self.manifest.ids
+        self.image_paths = self.manifest.image_paths()
+        self.mask_paths = self.manifest.mask_paths()
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, idx):
+      image_path = self.image_paths[idx]
+      mask_path = self.mask_paths[idx]
+
+      image, mask = Image.open(image_path), Image.open(mask_path)
+
+      # Potential background class handling (if needed):
+      # mask = mask - 1
+
+      if self.transform:
+        image = self.transform['img_transform'](image)
+        mask = self.transform['mask_transform'](mask)  # Apply transformations to mask as well
+
+      # mask = mask.squeeze(0)
+      return image, mask
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+def _resolve_paths(dataset):
+    # Unwrap the Subset produced by random_split down to the dataset file lists
+    indices = list(range(len(dataset)))
+    while isinstance(dataset, torch.utils.data.Subset):
+        indices = [dataset.indices[i] for i in indices]
+        dataset = dataset.dataset
+
+    image_paths = [dataset.image_paths[i] for i in indices]
+    mask_paths = [dataset.mask_paths[i] for i in indices]
+    return image_paths, mask_paths
+
+def pack_isic_shards(dataset, out_dir, size=128, shard_size=512, mask_format='packbits'):
+    """
+    Args:
+        dataset (Dataset): ISICDataset, or a Subset of one, providing the image/mask pairs.
+        out_dir (str): Directory receiving the shards and `index.json`.
+        size (int): Output side length, using the same Resize + CenterCrop as the PIL pipeline.
+        shard_size (int): Number of samples per shard file.
+        mask_format (str): 'packbits' stores binarized masks at one bit per pixel; 'raw' keeps
+            the resampled uint8 masks.
+    """
+    image_paths, mask_paths = _resolve_paths(dataset)
+    index_path = os.path.join(out_dir, "index.json")
+
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if (index['size'] == size and index.get('mask_format', 'raw') == mask_format
+                and index['image_paths'] == image_paths and index['mask_paths'] == mask_paths):
+            return index_path
+
+    os.makedirs(out_dir, exist_ok=True)
+    resize = transforms.Compose([transforms.Resize(size), transforms.CenterCrop(size)])
+
+    shards, entries = [], []
+    for start in range(0, len(image_paths), shard_size):
+        shard_id = len(shards)
+        count = min(shard_size, len(image_paths) - start)
+        images_file = f"images_{shard_id:05d}.npy"
+        masks_file = f"masks_{shard_id:05d}.npy"
+
+        images_mm = np.lib.format.open_memmap(os.path.join(out_dir, images_file), mode='w+', dtype=np.uint8, shape=(count, size, size, 3))
+        mask_width = -(-size // 8) if mask_format == 'packbits' else size
+        masks_mm = np.lib.format.open_memmap(os.path.join(out_dir, masks_file), mode='w+', dtype=np.uint8, shape=(count, size, mask_width))
+
+        for offset in range(count):
+            image = Image.open(image_paths[start + offset]).convert('RGB')
+            mask = Image.open(mask_paths[start + offset]).convert('L')
+            images_mm[offset] = np.asarray(resize(image), dtype=np.uint8)
+            mask = np.asarray(resize(mask), dtype=np.uint8)
+            masks_mm[offset] = pack_masks(mask) if mask_format == 'packbits' else mask
+            entries.append([shard_id, offset])
+
+        images_mm.flush()
+        masks_mm.flush()
+        del images_mm, masks_mm
+        shards.append({'images': images_file, 'masks': masks_file, 'count': count})
+
+    # The index is written last so an interrupted run is never mistaken for a complete one
+    with open(index_path, 'w') as f:
+        json.dump({
+            'size': size,
+            'mask_format': mask_format,
+            'shards': shards,
+            'entries': entries,
+            'image_paths': image_paths,
+            'mask_paths': mask_paths
+        }, f)
+    return index_path
+
+class PackedISICDataset(Dataset):
+    def __init__(self, shard_dir, transform=None, unpack_masks=False):
+        """
+        Args:
+            shard_dir (str): Directory written by `pack_isic_shards`.
+            transform (callable, optional): Applied to the (image, mask) uint8 tensor pair.
+            unpack_masks (bool): Serve bit-packed masks expanded to 1xHxW; implied by `transform`.
+
+        Samples are uint8 views of the shards: images are 3xHxW, masks are 1xHxW, or
+        1xHx(W/8) while bit-packed. Use `normalize_batch` on the collated batch to get model
+        inputs; it also unpacks the masks, on the batch's device.
+        """
+        with open(os.path.join(shard_dir, "index.json")) as f:
+            index = json.load(f)
+
+        self.shard_dir = shard_dir
+        self.shards = index['shards']
+        self.entries = index['entries']
+        self.image_paths = index['image_paths']
+        self.mask_paths = index['mask_paths']
+        self.size = index['size']
+        self.mask_format = index.get('mask_format', 'raw')
+        self.transform = transform
+        self.unpack_masks = unpack_masks or transform is not None
+        self.images = None
+        self.masks = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _open(self):
+        # Copy-on-write maps are writable from torch's point of view but never touch the files
+        self.images = [np.load(os.path.join(self.shard_dir, s['images']), mmap_mode='c') for s in self.shards]
+        self.masks = [np.load(os.path.join(self.shard_dir, s['masks']), mmap_mode='c') for s in self.shards]
+
+    def __getitem__(self, idx):
+        if self.images is None:
+            self._open()  # Opened lazily so each DataLoader worker maps the files itself
+
+        shard, offset = self.entries[idx]
+        image = torch.from_numpy(self.images[shard][offset]).permute(2, 0, 1)
+        mask = torch.from_numpy(self.masks[shard][offset]).unsqueeze(0)
+        if self.mask_format == 'packbits' and self.unpack_masks:
+            mask = unpack_masks(mask, self.size, dtype=torch.uint8).mul_(255)
+
+        if self.transform:
+            image, mask = self.transform(image, mask)
+        return image, mask
+
+def normalize_images(images):
+    if images.dtype == torch.uint8:
+        images = images.float().div_(255)
+        mean = images.new_tensor(IMAGENET_MEAN).view(1, -1, 1, 1)
+        std = images.new_tensor(IMAGENET_STD).view(1, -1, 1, 1)
+        images = images.sub_(mean).div_(std)
+    return images
+
+def masks_to_float(masks, width):
+    """Float [0, 1] masks from uint8 0-255 or bit-packed batches of images `width` pixels wide."""
+    if is_packed(masks, width):
+        return unpack_masks(masks, width)
+    if masks.dtype == torch.uint8:
+        return masks.float().div_(255)
+    return masks.float()
+
+def normalize_batch(images, masks):
+    """Turns collated uint8 batches into model inputs; float batches are passed through."""
+    masks = masks_to_float(masks, images.shape[-1])
+    images = normalize_images(images)
+    return images, masks
+
+class PairedBatchAugment(nn.Module):
+    def __init__(self, hflip_p=0.5, vflip_p=0.0, crop_scale=(1.0, 1.0), max_rotation=0.0,
+                 brightness=0.0, contrast=0.0, saturation=0.0, normalize=True):
+        """
+        Augments a collated batch on its device, drawing one set of random parameters per
+        sample and applying the geometric part identically to the image and its mask.
+
+        Args:
+            hflip_p (float): Probability of a horizontal flip.
+            vflip_p (float): Probability of a vertical flip.
+            crop_scale (tuple): Range of the random crop area as a fraction of the image.
+            max_rotation (float): Maximum absolute rotation in degrees.
+            brightness (float): Brightness factor jitter, sampled from [1 - b, 1 + b].
+            contrast (float): Contrast factor jitter, sampled from [1 - c, 1 + c].
+            saturation (float): Saturation factor jitter, sampled from [1 - s, 1 + s].
+            normalize (bool): Apply the ImageNet normalization expected by the encoder.
+        """
+        super(PairedBatchAugment, self).__init__()
+        self.hflip_p = hflip_p
+        self.vflip_p = vflip_p
+        self.crop_scale = crop_scale
+        self.max_rotation = max_rotation
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.normalize = normalize
+
+    def _uniform(self, n, low, high, device):
+        return torch.empty(n, device=device).uniform_(low, high)
+
+    def _geometric(self, images, masks, hflip, vflip):
+        n, device = images.size(0), images.device
+
+        # Side length of the crop relative to the image, and its centre within the free margin
+        scale = self._uniform(n, *self.crop_scale, device).sqrt()
+        tx = self._uniform(n, -1.0, 1.0, device) * (1 - scale)
+        ty = self._uniform(n, -1.0, 1.0, device) * (1 - scale)
+        angle = self._uniform(n, -self.max_rotation, self.max_rotation, device) * (math.pi / 180)
+
+        sx = torch.where(hflip, -scale, scale)
+        sy = torch.where(vflip, -scale, scale)
+        cos, sin = angle.cos(), angle.sin()
+
+        theta = torch.stack([
+            torch.stack([cos * sx, -sin * sy, tx], dim=1),
+            torch.stack([sin * sx, cos * sy, ty], dim=1)
+        ], dim=1)
+
+        grid = F.affine_grid(theta, list(images.shape), align_corners=False)
+        images = F.grid_sample(images, grid, mode='bilinear', padding_mode='reflection', align_corners=False)
+        # Nearest sampling keeps binary masks hard labels
+        masks = F.grid_sample(masks, grid, mode='nearest', padding_mode='reflection', align_corners=False)
+        return images, masks
+
+    def _color(self, images):
+        n, device = images.size(0), images.device
+        view = (n, 1, 1, 1)
+
+        if self.brightness > 0:
+            images = images * self._uniform(n, 1 - self.brightness, 1 + self.brightness, device).view(view)
+        if self.contrast > 0:
+            gray = (images * images.new_tensor([0.299, 0.587, 0.114]).view(1, 3, 1, 1)).sum(1, keepdim=True)
+            mean = gray.mean(dim=(1, 2, 3), keepdim=True)
+            factor = self._uniform(n, 1 - self.contrast, 1 + self.contrast, device).view(view)
+            images = (images - mean) * factor + mean
+        if self.saturation > 0:
+            gray = (images * images.new_tensor([0.299, 0.587, 0.114]).view(1, 3, 1, 1)).sum(1, keepdim=True)
+            factor = self._uniform(n, 1 - self.saturation, 1 + self.saturation, device).view(view)
+            images = (images - gray) * factor + gray
+        return images.clamp_(0, 1)
+
+    def forward(self, images, masks):
+        masks = masks_to_float(masks, images.shape[-1])
+        images = images.float().div_(255) if images.dtype == torch.uint8 else images.float()
+
+        n, device = images.size(0), images.device
+        hflip = torch.rand(n, device=device) < self.hflip_p
+        vflip = torch.rand(n, device=device) < self.vflip_p
+
+        if self.crop_scale != (1.0, 1.0) or self.max_rotation > 0:
+            images, masks = self._geometric(images, masks, hflip, vflip)
+        else:
+            # Flip-only fast path: a select between the batch and its flipped copy
+            images = torch.where(hflip.view(-1, 1, 1, 1), images.flip(-1), images)
+            masks = torch.where(hflip.view(-1, 1, 1, 1), masks.flip(-1), masks)
+            images = torch.where(vflip.view(-1, 1, 1, 1), images.flip(-2), images)
+            masks = torch.where(vflip.view(-1, 1, 1, 1), masks.flip(-2), masks)
+
+        if self.brightness > 0 or self.contrast > 0 or self.saturation > 0:
+            images = self._color(images)
+
+        if self.normalize:
+            mean = images.new_tensor(IMAGENET_MEAN).view(1, -1, 1, 1)
+            std = images.new_tensor(IMAGENET_STD).view(1, -1, 1, 1)
+            images = (images - mean) / std
+        return images, masks
+
+def build_transform(size=128, packed_masks=False):
+    """Per-sample PIL transforms producing uint8 tensors of side `size`.
+
+    Samples stay uint8 until collation; flips and normalization run on whole batches so the
+    image and its mask always receive the same random flip (see PairedBatchAugment).
+    With `packed_masks`, masks leave the loader workers bit-packed and are unpacked by
+    `normalize_batch` on the device.
+    """
+    mask_steps = [transforms.Resize(size), transforms.CenterCrop(size), transforms.PILToTensor()]
+    if packed_masks:
+        mask_steps.append(PackMasks())
+    return {
+        "img_transform": transforms.Compose([
+            transforms.Resize(size),
+            transforms.CenterCrop(size),
+            transforms.PILToTensor()
+        ]),
+        "mask_transform": transforms.Compose(mask_steps)
+    }
@@ -0,0 +1,5 @@
+"""Device shared by training, evaluation and inference."""
+
+import torch
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
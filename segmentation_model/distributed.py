@@ -0,0 +1,121 @@
+"""Multi-process CPU data-parallel training.
+
+`run_distributed` starts one process per core group with the gloo backend. Across several
+nodes, set NNODES, NODE_RANK, MASTER_ADDR and MASTER_PORT on each node and start the same
+command everywhere. Each rank trains on its DistributedSampler shard of ISICDataset; DDP
+all-reduces the gradients and rank 0 aggregates metrics and writes checkpoints.
+"""
+
+import json
+import os
+import tempfile
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader, random_split
+from torch.utils.data.distributed import DistributedSampler
+
+from .checkpointing import CheckpointManager
+from .data import ISICDataset, PackedISICDataset, PairedBatchAugment, build_transform, normalize_batch
+from .input_pipeline import loader_kwargs
+from .models import build_encoder_decoder
+from .trainer import MobileNetTrainer
+
+def _distributed_entry(local_rank, nprocs, fn, args):
+    nnodes = int(os.environ.get('NNODES', 1))
+    node_rank = int(os.environ.get('NODE_RANK', 0))
+    os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+    os.environ.setdefault('MASTER_PORT', '29500')
+
+    rank, world_size = node_rank * nprocs + local_rank, nnodes * nprocs
+    # Split the cores between the local processes instead of letting each one use all of them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // nprocs))
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    try:
+        fn(rank, world_size, *args)
+    finally:
+        dist.destroy_process_group()
+
+def run_distributed(fn, nprocs, *args):
+    """Runs `fn(rank, world_size, *args)` in `nprocs` local processes; `fn` must be importable."""
+    mp.spawn(_distributed_entry, args=(nprocs, fn, args), nprocs=nprocs, join=True)
+
+def build_distributed_loader(dataset, batch_size, shuffle, pipeline=None):
+    sampler = DistributedSampler(dataset, shuffle=shuffle)
+    return DataLoader(dataset, batch_size=batch_size, sampler=sampler, **loader_kwargs(pipeline))
+
+def distributed_train_worker(rank, world_size, run_config):
+    """
+    Args:
+        rank (int): Global rank, provided by `run_distributed`.
+        world_size (int): Number of processes in the group.
+        run_config (dict): Keys `train_image_dir`, `train_mask_dir`, `num_epochs`, `learning_rate`,
+            `batch_size` (per process) and `num_classes`; optional `shard_dir` (packed shards to use),
+            `pretrained_encoder` (default True), `accumulation_steps`, `freeze_encoder`, `val_size`, `seed`,
+            `checkpoint_dir` (rank 0 checkpoints there every epoch, and every `checkpoint_every_steps`
+            optimizer steps if set), `resume` (continue from the latest checkpoint in `checkpoint_dir`),
+            `input_pipeline` (INPUT_PIPELINES name or settings for the loaders; their workers share the
+            cores with the training processes) and `results_path` (rank 0 writes the per-epoch metrics
+            there as JSON).
+    """
+    torch.manual_seed(run_config.get('seed', 0))
+    if run_config.get('shard_dir'):
+        dataset = PackedISICDataset(run_config['shard_dir'])
+    else:
+        dataset = ISICDataset(run_config['train_image_dir'], run_config['train_mask_dir'], transform=build_transform(128))
+
+    # Every rank has to agree on the split, so it is drawn from a fixed seed
+    val_size = run_config.get('val_size', 0.1)
+    generator = torch.Generator().manual_seed(run_config.get('seed', 0))
+    train_subset, val_subset = random_split(dataset, lengths=[1 - val_size, val_size], generator=generator)
+
+    pipeline = run_config.get('input_pipeline')
+    train_loader = build_distributed_loader(train_subset, run_config['batch_size'], shuffle=True, pipeline=pipeline)
+    val_loader = build_distributed_loader(val_subset, run_config['batch_size'], shuffle=False, pipeline=pipeline)
+
+    model = build_encoder_decoder(run_config['num_classes'], pretrained_encoder=run_config.get('pretrained_encoder', True))
+    if run_config.get('freeze_encoder', True):
+        model.mobilenet.requires_grad_(False)
+
+    checkpoint_manager = None
+    if run_config.get('checkpoint_dir'):
+        checkpoint_manager = CheckpointManager(run_config['checkpoint_dir'], every_n_steps=run_config.get('checkpoint_every_steps'))
+
+    trainer = MobileNetTrainer(model, train_loader, num_classes=run_config['num_classes'], val_loader=val_loader,
+                               lr=run_config['learning_rate'], batch_transform=normalize_batch,
+                               train_batch_transform=PairedBatchAugment(hflip_p=0.5), distributed=True,
+                               checkpoint_manager=checkpoint_manager, accumulation_steps=run_config.get('accumulation_steps', 1))
+    if checkpoint_manager is not None and run_config.get('resume') and checkpoint_manager.latest() is not None:
+        trainer.resume(checkpoint_manager.latest())
+    trainer.train(run_config['num_epochs'])
+    if checkpoint_manager is not None:
+        checkpoint_manager.close()
+
+    if rank == 0 and run_config.get('results_path'):
+        with open(run_config['results_path'], 'w') as f:
+            json.dump({'world_size': world_size, 'throughput': trainer.throughput, 'metrics': trainer.metric_history}, f)
+
+def benchmark_ddp_scaling(run_config, max_procs=None, epochs=2):
+    """Trains with 1..max_procs local processes and reports aggregate throughput and scaling efficiency."""
+    max_procs = max_procs or os.cpu_count() or 1
+    counts = sorted({1, max_procs} | {2 ** i for i in range(1, max_procs.bit_length()) if 2 ** i <= max_procs})
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for nprocs in counts:
+            results_path = os.path.join(tmp, f"ddp_{nprocs}.json")
+            run_distributed(distributed_train_worker, nprocs, dict(run_config, num_epochs=epochs, results_path=results_path, checkpoint_dir=None))
+            with open(results_path) as f:
+                run = json.load(f)
+            # The first epoch includes process start-up and loader warm-up
+            measured = run['throughput'][1:] or run['throughput']
+            results.append({'nprocs': nprocs, 'samples_per_sec': sum(measured) / len(measured)})
+
+    base = results[0]['samples_per_sec']
+    print(f"{'Processes':>10}{'Samples/s':>12}{'Speed-up':>10}{'Efficiency':>12}")
+    for r in results:
+        r['speedup'] = r['samples_per_sec'] / base
+        r['efficiency'] = r['speedup'] / r['nprocs']
+        print(f"{r['nprocs']:>10}{r['samples_per_sec']:>12.1f}{r['speedup']:>9.2f}x{r['efficiency']:>11.0%}")
+    return results
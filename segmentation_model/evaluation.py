@@ -0,0 +1,229 @@
+"""Single-pass evaluation of several models.
+
+The test set is read, decoded and transferred once; every batch is then fanned out to all
+models, optionally on parallel threads (and CUDA streams), so evaluating N checkpoints costs
+one pass over the data instead of N.
+"""
+
+import argparse
+import contextlib
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, SequentialSampler
+
+from .data import ISICDataset, build_transform, normalize_batch
+from .devices import device
+from .metrics import SegmentationMetrics
+from .models import DECODER_VARIANTS, build_encoder_decoder
+from .tta import TTA_CONFIGS, build_tta
+
+def load_model(checkpoint, num_classes=1, decoder='baseline'):
+    """EncoderDecoder from a state_dict file or a MobileNetTrainer checkpoint (which holds it under 'model')."""
+    state = torch.load(checkpoint, map_location='cpu', weights_only=False)
+    if 'model' in state and isinstance(state['model'], dict):
+        state = state['model']
+    model = build_encoder_decoder(num_classes, pretrained_encoder=False, decoder=decoder)
+    model.load_state_dict(state)
+    return model
+
+def parse_checkpoint_spec(spec, decoder='baseline'):
+    """
+    (name, path, decoder) of a `NAME=PATH[:DECODER]` command-line spec.
+
+    Args:
+        spec (str): Checkpoint path, optionally prefixed by `NAME=` (default: the file name) and
+            suffixed by `:DECODER`, a DECODER_VARIANTS name.
+        decoder (str): Decoder variant of specs without a suffix.
+    """
+    name, sep, path = spec.partition('=')
+    if not sep:
+        name, path = '', spec
+    head, sep, tail = path.rpartition(':')
+    if sep and tail in DECODER_VARIANTS:
+        path, decoder = head, tail
+    elif sep and not os.path.exists(path):
+        raise ValueError(f"Unknown decoder '{tail}' in '{spec}', expected one of {list(DECODER_VARIANTS)}")
+    return name or os.path.basename(path), path, decoder
+
+def _dataset_ids(loader):
+    # Per-image IDs are only meaningful when the loader visits the dataset in order
+    if isinstance(loader.sampler, SequentialSampler) and hasattr(loader.dataset, 'ids'):
+        return loader.dataset.ids
+    return None
+
+class MultiModelEvaluator():
+    def __init__(self, models, batch_transform=normalize_batch, concurrent=False, precision='fp32', tta=None,
+                 num_classes=1, decoder='baseline', input_sizes=None):
+        """
+        Args:
+            models (dict): Name -> EncoderDecoder, or path of a checkpoint loaded with `load_model`.
+            batch_transform (callable): Turns collated batches into model inputs; applied once per batch.
+            concurrent (bool): Run the models of a batch on parallel threads, each on its own CUDA stream.
+            precision (str): 'fp32' or 'bf16' autocast.
+            tta (str or dict, optional): TTA_CONFIGS name or kwargs applied to every model.
+            num_classes (int): Output classes of checkpoints given as paths.
+            decoder (str): Decoder variant of checkpoints given as paths.
+            input_sizes (dict, optional): Name -> image side the model was trained at. Its inputs are
+                resized to that side and its predictions resized back, so models trained at different
+                resolutions are scored against the same, full-resolution labels.
+        """
+        if precision not in ('fp32', 'bf16'):
+            raise ValueError(f"Unsupported precision '{precision}', expected 'fp32' or 'bf16'")
+        self.models = {}
+        for name, model in models.items():
+            if isinstance(model, str):
+                model = load_model(model, num_classes=num_classes, decoder=decoder)
+            self.models[name] = build_tta(model.to(device).eval(), tta)
+        self.input_sizes = input_sizes or {}
+        self.batch_transform = batch_transform
+        self.concurrent = concurrent and len(self.models) > 1
+        self.precision = precision
+        self.streams = {}
+        if self.concurrent and device.type == 'cuda':
+            self.streams = {name: torch.cuda.Stream() for name in self.models}
+
+    def _predict(self, name, inputs):
+        full_size = inputs.shape[-2:]
+        stream = self.streams.get(name)
+        if stream is not None:
+            stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream) if stream is not None else contextlib.nullcontext(), torch.no_grad():
+            autocast = torch.autocast(device_type=device.type, dtype=torch.bfloat16) if self.precision == 'bf16' else contextlib.nullcontext()
+            size = self.input_sizes.get(name)
+            resize = size is not None and size != inputs.shape[-1]
+            if resize:
+                inputs = F.interpolate(inputs, size=(size, size), mode='bilinear', align_corners=False, antialias=True)
+            with autocast:
+                outputs = self.models[name](inputs).float()
+            if resize:
+                outputs = F.interpolate(outputs, size=full_size, mode='bilinear', align_corners=False)
+        if stream is not None:
+            torch.cuda.current_stream().wait_stream(stream)
+        return outputs
+
+    def run(self, loader, visualization_sink=None, plot_batches=0):
+        """
+        Streams `loader` once through every model.
+
+        Args:
+            loader (DataLoader): Evaluation batches; per-image IDs are reported when it is unshuffled
+                over a dataset with an `ids` attribute, positions otherwise.
+            visualization_sink (VisualizationSink, optional): Receives the label and every model's
+                prediction for the first `plot_batches` batches.
+            plot_batches (int): Number of batches sent to `visualization_sink`.
+
+        Returns:
+            dict: 'aggregate' (name -> SegmentationMetrics results) and 'per_image' (one row per image).
+        """
+        metrics = {name: SegmentationMetrics() for name in self.models}
+        scores = {name: [] for name in self.models}
+        pool = ThreadPoolExecutor(len(self.models)) if self.concurrent else None
+
+        try:
+            with torch.no_grad():
+                for i, (inputs, labels) in enumerate(loader):
+                    inputs, labels = self.batch_transform(inputs.to(device, non_blocking=True), labels.to(device, non_blocking=True))
+
+                    if pool is not None:
+                        futures = {name: pool.submit(self._predict, name, inputs) for name in self.models}
+                        outputs = {name: future.result() for name, future in futures.items()}
+                    else:
+                        outputs = {name: self._predict(name, inputs) for name in self.models}
+
+                    for name, output in outputs.items():
+                        metrics[name].update(output, labels)
+                        iou, dice, _, _, _ = metrics[name].batch_scores(output, labels)
+                        scores[name].append(torch.stack([iou[0], dice[0]]))  # Stays on the device
+
+                    if visualization_sink is not None and i < plot_batches:
+                        visualization_sink.submit("model_comparison", i, dict({'Label Mask': labels}, **outputs))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        aggregate = {name: m.compute() for name, m in metrics.items()}
+        per_model = {name: torch.cat(s, dim=1).tolist() for name, s in scores.items()}  # One host copy per model
+
+        ids = _dataset_ids(loader)
+        num_images = len(next(iter(per_model.values()))[0])
+        per_image = []
+        for j in range(num_images):
+            row = {'image': ids[j] if ids is not None else j}
+            for name, (ious, dices) in per_model.items():
+                row[f"{name}/iou"] = ious[j]
+                row[f"{name}/dice"] = dices[j]
+            per_image.append(row)
+
+        self.results = {'aggregate': aggregate, 'per_image': per_image}
+        return self.results
+
+    def print_report(self, top_k=5):
+        """Aggregate table, how often each model is best per image, and the images they disagree on most."""
+        aggregate, per_image = self.results['aggregate'], self.results['per_image']
+        names = list(aggregate)
+
+        wins = {name: 0 for name in names}
+        for row in per_image:
+            wins[max(names, key=lambda name: row[f"{name}/dice"])] += 1
+
+        print(f"{'Model':<28}{'IoU':>10}{'Dice':>10}{'IoU@0.5':>10}{'Dice@0.5':>10}{'Global Dice':>13}{'Best on':>10}")
+        for name, r in aggregate.items():
+            print(f"{name:<28}{r['iou']:>10.4f}{r['dice']:>10.4f}{r['iou@0.5']:>10.4f}{r['dice@0.5']:>10.4f}{r['global_dice']:>13.4f}{wins[name]:>10}")
+
+        if len(names) > 1 and top_k > 0:
+            spread = lambda row: max(row[f"{n}/dice"] for n in names) - min(row[f"{n}/dice"] for n in names)
+            print("\nLargest per-image Dice disagreements:")
+            print(f"{'Image':<20}" + "".join(f"{name[:14]:>16}" for name in names))
+            for row in sorted(per_image, key=spread, reverse=True)[:top_k]:
+                print(f"{str(row['image']):<20}" + "".join(f"{row[f'{name}/dice']:>16.4f}" for name in names))
+
+    def save_csv(self, path):
+        """Writes the per-image IoU/Dice of every model."""
+        rows = self.results['per_image']
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ['image'])
+            writer.writeheader()
+            writer.writerows(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate several checkpoints in one pass over a test set.")
+    parser.add_argument('--checkpoint', action='append', required=True, metavar="NAME=PATH[:DECODER]",
+                        help="State dict or trainer checkpoint, with its decoder variant if it is not --decoder; repeat once per model")
+    parser.add_argument('--image-dir', required=True)
+    parser.add_argument('--mask-dir', required=True)
+    parser.add_argument('--num-classes', type=int, default=1)
+    parser.add_argument('--decoder', choices=list(DECODER_VARIANTS), default='baseline',
+                        help="Decoder variant of checkpoints without a :DECODER suffix")
+    parser.add_argument('--size', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrent', action='store_true', help="Run the models of each batch in parallel")
+    parser.add_argument('--precision', choices=['fp32', 'bf16'], default='fp32')
+    parser.add_argument('--tta', choices=list(TTA_CONFIGS), default='none')
+    parser.add_argument('--csv', help="Write the per-image table here")
+    args = parser.parse_args(argv)
+
+    models = {}
+    for spec in args.checkpoint:
+        try:
+            name, path, decoder = parse_checkpoint_spec(spec, args.decoder)
+        except ValueError as e:
+            parser.error(str(e))
+        models[name] = load_model(path, num_classes=args.num_classes, decoder=decoder)
+    dataset = ISICDataset(args.image_dir, args.mask_dir, transform=build_transform(args.size, packed_masks=True))
+    loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False, num_workers=args.workers)
+
+    evaluator = MultiModelEvaluator(models, concurrent=args.concurrent, precision=args.precision, tta=args.tta)
+    results = evaluator.run(loader)
+    evaluator.print_report()
+    if args.csv:
+        evaluator.save_csv(args.csv)
+    return results
+
+if __name__ == "__main__":
+    main()
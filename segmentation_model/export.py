@@ -0,0 +1,157 @@
+"""Frozen inference export.
+
+Folds every BatchNorm into the preceding convolution, drops the unused dropout/classifier
+modules, and writes a frozen TorchScript module and an ONNX graph with dynamic batch and
+spatial dimensions. Neither artifact needs this package at inference time.
+"""
+
+import argparse
+import copy
+import os
+import time
+
+import torch
+import torch.nn as nn
+
+from .models import DECODER_VARIANTS, build_encoder_decoder
+
+def _fold_conv_bn_sequential(module):
+    # MobileNetV2 keeps Conv2d -> BatchNorm2d pairs adjacent inside (nested) Sequentials
+    for child in module.children():
+        _fold_conv_bn_sequential(child)
+
+    if isinstance(module, nn.Sequential):
+        for i in range(len(module) - 1):
+            if isinstance(module[i], nn.Conv2d) and isinstance(module[i + 1], nn.BatchNorm2d):
+                module[i] = torch.nn.utils.fusion.fuse_conv_bn_eval(module[i], module[i + 1])
+                module[i + 1] = nn.Identity()
+
+def _fold_conv_bn_attributes(module):
+    # MobileNetDecoder names its pairs conv<i>/bn<i>
+    for name, child in list(module.named_children()):
+        conv_name = 'conv' + name[2:]
+        if name.startswith('bn') and isinstance(child, nn.BatchNorm2d) and isinstance(getattr(module, conv_name, None), nn.Conv2d):
+            setattr(module, conv_name, torch.nn.utils.fusion.fuse_conv_bn_eval(getattr(module, conv_name), child))
+            setattr(module, name, nn.Identity())
+
+def _strip_dropout(module):
+    for name, child in module.named_children():
+        if isinstance(child, nn.modules.dropout._DropoutNd):  # Dropout, Dropout2d, ...
+            setattr(module, name, nn.Identity())
+        else:
+            _strip_dropout(child)
+
+def fold_batchnorm(model):
+    """Returns an eval-mode copy of `model` as a features -> decoder -> sigmoid Sequential with BN folded."""
+    model = copy.deepcopy(model).cpu().eval()
+    model.mobilenet.classifier = nn.Identity()  # The ImageNet head is never used
+
+    _fold_conv_bn_sequential(model.mobilenet.features)
+    _fold_conv_bn_sequential(model.decoder)
+    _fold_conv_bn_attributes(model.decoder)
+    _strip_dropout(model)
+
+    return nn.Sequential(model.mobilenet.features, model.decoder, nn.Sigmoid()).eval()
+
+def export_inference_graph(model, out_dir, size=128, opset=17, export_onnx=True):
+    """
+    Args:
+        model (EncoderDecoder): Trained model.
+        out_dir (str): Receives `encoder_decoder.ts` and `encoder_decoder.onnx`.
+        size (int): Spatial size of the example input used for tracing.
+        opset (int): ONNX opset version.
+        export_onnx (bool): Also write the ONNX artifact.
+
+    Returns:
+        dict: Paths of the written artifacts.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    folded = fold_batchnorm(model)
+    example = torch.randn(2, 3, size, size)
+    paths = {}
+
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(folded, example))
+    paths['torchscript'] = os.path.join(out_dir, "encoder_decoder.ts")
+    torch.jit.save(scripted, paths['torchscript'])
+
+    if export_onnx:
+        paths['onnx'] = os.path.join(out_dir, "encoder_decoder.onnx")
+        dynamic = {0: 'batch', 2: 'height', 3: 'width'}
+        torch.onnx.export(folded, example, paths['onnx'], input_names=['image'], output_names=['mask'],
+                          dynamic_axes={'image': dynamic, 'mask': dynamic}, opset_version=opset)
+    return paths
+
+def _onnx_session(onnx_path):
+    try:
+        import onnxruntime
+    except ImportError:
+        print("onnxruntime is not installed; skipping the ONNX artifact")
+        return None
+    return onnxruntime.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+
+def check_export_parity(model, paths, shapes=((1, 128, 128), (4, 128, 128), (2, 256, 192)), atol=1e-4):
+    """Raises if the exported artifacts disagree with eager `model` by more than `atol`."""
+    model = model.cpu().eval()
+    scripted = torch.jit.load(paths['torchscript'])
+    session = _onnx_session(paths['onnx']) if 'onnx' in paths else None
+    worst = {'torchscript': 0.0, 'onnx': 0.0}
+
+    with torch.no_grad():
+        for batch, height, width in shapes:
+            inputs = torch.randn(batch, 3, height, width)
+            expected = model(inputs)
+            worst['torchscript'] = max(worst['torchscript'], (scripted(inputs) - expected).abs().max().item())
+            if session is not None:
+                onnx_out = torch.from_numpy(session.run(None, {'image': inputs.numpy()})[0])
+                worst['onnx'] = max(worst['onnx'], (onnx_out - expected).abs().max().item())
+
+    print(f"Max abs difference vs eager: TorchScript {worst['torchscript']:.2e}, ONNX {worst['onnx']:.2e}")
+    failed = [name for name, diff in worst.items() if diff > atol]
+    if failed:
+        raise RuntimeError(f"Exported {', '.join(failed)} output differs from eager EncoderDecoder by more than {atol}")
+    return worst
+
+def benchmark_export_latency(model, paths, batch_size=16, size=128, iters=50, warmup=5):
+    """CPU latency per batch of eager EncoderDecoder against the exported artifacts."""
+    inputs = torch.randn(batch_size, 3, size, size)
+    runners = {'eager': model.cpu().eval(), 'torchscript': torch.jit.load(paths['torchscript'])}
+    session = _onnx_session(paths['onnx']) if 'onnx' in paths else None
+    if session is not None:
+        runners['onnx'] = lambda x: session.run(None, {'image': x.numpy()})
+
+    results = {}
+    with torch.no_grad():
+        for name, run in runners.items():
+            for _ in range(warmup):
+                run(inputs)
+            start = time.perf_counter()
+            for _ in range(iters):
+                run(inputs)
+            results[name] = 1000 * (time.perf_counter() - start) / iters
+
+    for name, ms in results.items():
+        print(f"{name:<12}{ms:>10.2f} ms/batch{results['eager'] / ms:>8.2f}x")
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a frozen TorchScript/ONNX inference graph.")
+    parser.add_argument('--weights', required=True, help="EncoderDecoder state_dict saved with torch.save")
+    parser.add_argument('--out-dir', required=True)
+    parser.add_argument('--num-classes', type=int, default=1)
+    parser.add_argument('--decoder', choices=list(DECODER_VARIANTS), default='baseline')
+    parser.add_argument('--size', type=int, default=128)
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--no-onnx', action='store_true')
+    parser.add_argument('--skip-checks', action='store_true', help="Skip the parity test and latency benchmark")
+    args = parser.parse_args(argv)
+
+    model = build_encoder_decoder(args.num_classes, weights_path=args.weights, decoder=args.decoder)
+    paths = export_inference_graph(model, args.out_dir, size=args.size, opset=args.opset, export_onnx=not args.no_onnx)
+    if not args.skip_checks:
+        check_export_parity(model, paths)
+        benchmark_export_latency(model, paths, size=args.size)
+    return paths
+
+if __name__ == "__main__":
+    main()
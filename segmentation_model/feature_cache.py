@@ -0,0 +1,170 @@
+"""Frozen-encoder feature cache.
+
+With a frozen encoder the features of an image never change, so they are computed once
+(for the image and its horizontal flip) into memory-mapped `.npy` files and the decoder is
+trained straight from them.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torchvision.transforms as transforms
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from torch.utils.data.distributed import DistributedSampler
+
+from .data import _resolve_paths, normalize_batch
+from .devices import device
+from .mask_codec import pack_masks, unpack_masks
+
+def _without_random_flip(transform):
+    return transforms.Compose([t for t in transform.transforms if not isinstance(t, transforms.RandomHorizontalFlip)])
+
+class _DeterministicPairs(Dataset):
+    def __init__(self, image_paths, mask_paths, transform):
+        self.image_paths = image_paths
+        self.mask_paths = mask_paths
+        self.img_transform = _without_random_flip(transform['img_transform'])
+        self.mask_transform = _without_random_flip(transform['mask_transform'])
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, idx):
+        image, mask = Image.open(self.image_paths[idx]), Image.open(self.mask_paths[idx])
+        return self.img_transform(image), self.mask_transform(mask)
+
+class EncoderFeatureCache():
+    def __init__(self, encoder, dataset, cache_dir, transform, batch_size=32, dtype=np.float16):
+        """
+        Args:
+            encoder (nn.Module): Frozen MobileNetV2; only `encoder.features` is used.
+            dataset (Dataset): ISICDataset, or a Subset of one, whose features are cached.
+            cache_dir (str): Directory holding the memory-mapped features and masks.
+            transform (dict): The `img_transform`/`mask_transform` pair used by the dataset.
+                Random flips are stripped; both flip variants are stored instead.
+            batch_size (int): Batch size for the one-off encoder pass.
+            dtype (np.dtype): Storage dtype of the features; masks are stored bit-packed.
+        """
+        self.encoder = encoder
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self.dtype = np.dtype(dtype)
+        self.image_paths, self.mask_paths = _resolve_paths(dataset)
+        self.source = _DeterministicPairs(self.image_paths, self.mask_paths, transform)
+
+        self.features_path = os.path.join(cache_dir, "features.npy")
+        self.masks_path = os.path.join(cache_dir, "masks.npy")
+        self.meta_path = os.path.join(cache_dir, "meta.json")
+
+    def fingerprint(self):
+        """Key that invalidates the cache when encoder weights, transforms or files change."""
+        digest = hashlib.sha1()
+        for name, tensor in sorted(self.encoder.state_dict().items()):
+            digest.update(name.encode())
+            digest.update(tensor.detach().cpu().numpy().tobytes())
+        digest.update(repr(self.source.img_transform).encode())
+        digest.update(repr(self.source.mask_transform).encode())
+        digest.update("\n".join(self.image_paths + self.mask_paths).encode())
+        digest.update(self.dtype.str.encode())
+        digest.update(b"packbits-masks")
+        return digest.hexdigest()
+
+    def is_valid(self):
+        if not os.path.exists(self.meta_path):
+            return False
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        return meta.get('fingerprint') == self.fingerprint()
+
+    def build(self, force=False):
+        if not force and self.is_valid():
+            return self
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)  # Mark the cache invalid until the rewrite completes
+
+        loader = DataLoader(self.source, batch_size=self.batch_size, shuffle=False)
+        was_training = self.encoder.training
+        self.encoder = self.encoder.to(device).eval()
+
+        features_mm, masks_mm = None, None
+        offset = 0
+        with torch.no_grad():
+            for images, masks in loader:
+                images, masks = normalize_batch(images.to(device), masks)
+                flipped = torch.flip(images, dims=[-1])
+                features = self.encoder.features(torch.cat([images, flipped]))
+                features = torch.stack(features.chunk(2), dim=1).cpu().numpy()
+                mask_width = masks.shape[-1]
+                masks = pack_masks(torch.stack([masks, torch.flip(masks, dims=[-1])], dim=1)).numpy()
+
+                if features_mm is None:
+                    n = len(self.source)
+                    features_mm = np.lib.format.open_memmap(self.features_path, mode='w+', dtype=self.dtype, shape=(n,) + features.shape[1:])
+                    masks_mm = np.lib.format.open_memmap(self.masks_path, mode='w+', dtype=np.uint8, shape=(n,) + masks.shape[1:])
+
+                features_mm[offset:offset + len(features)] = features
+                masks_mm[offset:offset + len(masks)] = masks
+                offset += len(features)
+
+        features_mm.flush()
+        masks_mm.flush()
+        del features_mm, masks_mm
+        self.encoder.train(was_training)
+
+        with open(self.meta_path, 'w') as f:
+            json.dump({'fingerprint': self.fingerprint(), 'num_samples': offset, 'mask_width': mask_width}, f)
+        return self
+
+    def dataset(self, flip_p=0.5):
+        self.build()
+        with open(self.meta_path) as f:
+            mask_width = json.load(f)['mask_width']
+        return CachedFeatureDataset(self.features_path, self.masks_path, mask_width, flip_p=flip_p)
+
+    def loader(self, batch_size, shuffle=True, flip_p=0.5, distributed=False):
+        if distributed:
+            if dist.get_rank() == 0:
+                self.build()
+            dist.barrier()  # Other ranks wait for rank 0 to write the cache
+            dataset = self.dataset(flip_p=flip_p)
+            return DataLoader(dataset, batch_size=batch_size, sampler=DistributedSampler(dataset, shuffle=shuffle))
+        return DataLoader(self.dataset(flip_p=flip_p), batch_size=batch_size, shuffle=shuffle)
+
+class CachedFeatureDataset(Dataset):
+    def __init__(self, features_path, masks_path, mask_width, flip_p=0.5):
+        """
+        Args:
+            features_path (str): `.npy` file of shape (N, 2, C, h, w); index 1 holds the flipped image.
+            masks_path (str): Bit-packed `.npy` file of shape (N, 2, 1, H, W / 8) matching `features_path`.
+            mask_width (int): Width W of the unpacked masks.
+            flip_p (float): Probability of serving the horizontally flipped variant.
+        """
+        self.features_path = features_path
+        self.masks_path = masks_path
+        self.mask_width = mask_width
+        self.flip_p = flip_p
+        self.features = None
+        self.masks = None
+        self.length = np.load(features_path, mmap_mode='r').shape[0]
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        # [N, 2, ...] fp16 features and packed masks, index 1 the flipped image; a sample reads one
+        # variant from each array, so only the pages it touches are faulted in
+        if self.features is None:
+            self.features = np.load(self.features_path, mmap_mode='r')
+            self.masks = np.load(self.masks_path, mmap_mode='r')
+
+        variant = int(torch.rand(1).item() < self.flip_p)
+        features = torch.from_numpy(np.asarray(self.features[idx, variant], dtype=np.float32))
+        mask = unpack_masks(torch.from_numpy(np.array(self.masks[idx, variant])), self.mask_width)
+        return features, mask
@@ -0,0 +1,203 @@
+"""Tiled directory inference.
+
+Streams a directory of full-size dermoscopy images through overlapping sliding-window tiles and
+writes one mask per image at its original resolution. Decoding and PNG encoding run on thread
+pools, and at most `prefetch` images are held in memory at any time.
+"""
+
+import argparse
+import collections
+import contextlib
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torchvision.transforms as transforms
+from PIL import Image
+
+from .data import normalize_images
+from .devices import device
+from .manifest import IMAGE_EXTENSIONS
+from .mask_codec import MASK_FORMATS, pack_masks, rle_encode, unpack_masks
+from .models import DECODER_VARIANTS, build_encoder_decoder
+from .tta import TTA_CONFIGS, build_tta
+
+def _blend_window(tile, overlap, device):
+    # Linear ramp over the overlap so neighbouring tiles cross-fade instead of leaving seams
+    ramp = torch.ones(tile, device=device)
+    if overlap > 0:
+        edge = torch.linspace(1.0 / (overlap + 1), 1.0, overlap, device=device)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = edge.flip(0)
+    return ramp[:, None] * ramp[None, :]
+
+def _padded_size(length, tile, stride):
+    # Smallest size >= length that a regular tile/stride grid covers exactly
+    if length <= tile:
+        return tile
+    return tile + math.ceil((length - tile) / stride) * stride
+
+def _unfold_tiles(image, tile, stride):
+    """(3, H, W) -> (L, 3, tile, tile) tiles on a regular grid, plus the padded size."""
+    _, h, w = image.shape
+    padded_h, padded_w = _padded_size(h, tile, stride), _padded_size(w, tile, stride)
+    image = F.pad(image[None], (0, padded_w - w, 0, padded_h - h), mode='replicate')
+    tiles = F.unfold(image, kernel_size=tile, stride=stride)  # (1, 3 * tile * tile, L)
+    tiles = tiles[0].transpose(0, 1).reshape(-1, 3, tile, tile)
+    return tiles, (padded_h, padded_w)
+
+def _fold_tiles(probs, window, size, padded_size, tile, stride):
+    """Blends (L, tile, tile) tile probabilities back into an (H, W) map."""
+    columns = (probs * window).flatten(1).transpose(0, 1)[None]
+    weights = window.flatten()[:, None].expand(-1, probs.size(0))[None]
+    acc = F.fold(columns, output_size=padded_size, kernel_size=tile, stride=stride)
+    norm = F.fold(weights, output_size=padded_size, kernel_size=tile, stride=stride)
+    return (acc / norm)[0, 0, :size[0], :size[1]]
+
+def _check_tiling(tile, overlap):
+    if not 0 <= overlap < tile:
+        raise ValueError(f"overlap must be in [0, tile), got overlap={overlap} for tile={tile}")
+
+def tiled_predict(model, images, tile=128, overlap=32, batch_size=64):
+    """
+    Args:
+        model (EncoderDecoder): Model in eval mode, returning probabilities.
+        images (list): Normalized (3, H, W) float tensors on the model's device; sizes may differ.
+        tile (int): Side length of the square tiles; a multiple of 32 for the encoder stride.
+        overlap (int): Overlap between neighbouring tiles, in pixels.
+        batch_size (int): Tiles per forward pass. Tiles of all images are pooled into these batches.
+
+    Returns:
+        list: (H, W) probability maps, one per image.
+    """
+    _check_tiling(tile, overlap)
+    stride = tile - overlap
+    window = _blend_window(tile, overlap, images[0].device)
+
+    unfolded = [_unfold_tiles(image, tile, stride) for image in images]
+    tiles = torch.cat([t for t, _ in unfolded])
+    probs = torch.cat([model(tiles[i:i + batch_size])[:, 0].float() for i in range(0, len(tiles), batch_size)])
+
+    maps = []
+    for image, chunk, (_, padded_size) in zip(images, probs.split([len(t) for t, _ in unfolded]), unfolded):
+        maps.append(_fold_tiles(chunk, window, image.shape[-2:], padded_size, tile, stride))
+    return maps
+
+def _decode_for_inference(path, working_size):
+    image = Image.open(path).convert('RGB')
+    original_size = image.size[::-1]  # (H, W)
+    if working_size is not None:
+        image = transforms.functional.resize(image, working_size)  # Shorter side -> working_size
+    return path, original_size, transforms.functional.pil_to_tensor(image)
+
+def _write_mask(packed, size, out_base, mask_format):
+    # Masks come off the device bit-packed; PNG and RLE are produced on the writer threads
+    if mask_format == 'packbits':
+        out_path = out_base + ".npz"
+        np.savez(out_path, bits=packed, size=np.asarray(size))
+    elif mask_format == 'rle':
+        out_path = out_base + ".json"
+        with open(out_path, 'w') as f:
+            json.dump(rle_encode(unpack_masks(packed, size[1])), f)
+    else:
+        out_path = out_base + ".png"
+        Image.fromarray(unpack_masks(packed, size[1]) * 255).save(out_path)
+    return out_path
+
+def run_directory_inference(model, input_dir, output_dir, tile=128, overlap=32, batch_size=64, working_size=128,
+                            threshold=0.5, num_workers=4, prefetch=16, group_size=8, precision='fp32', mask_format='png',
+                            tta=None):
+    """
+    Args:
+        model (EncoderDecoder): Trained model.
+        input_dir (str): Directory of images; files with other extensions are ignored.
+        output_dir (str): Receives one mask per image at the original image resolution.
+        working_size (int, optional): Shorter side the image is resized to before tiling, to
+            match the scale seen in training (`build_transform` resizes the shorter side to 128).
+            None tiles the full-resolution image.
+        threshold (float): Probability threshold of the written binary mask.
+        num_workers (int): Threads for decoding and for encoding the output PNGs.
+        prefetch (int): Maximum number of decoded images and pending writes held in memory.
+        group_size (int): Images whose tiles are pooled into the same forward batches.
+        precision (str): 'fp32' or 'bf16' autocast.
+        mask_format (str): 'png' writes `<stem>.png`; 'packbits' writes `<stem>.npz` holding the
+            `np.packbits` rows and the (H, W) size; 'rle' writes `<stem>.json` (see `rle_encode`).
+        tta (str or dict, optional): TTA_CONFIGS name or kwargs; every tile batch then carries all views.
+    """
+    if mask_format not in MASK_FORMATS:
+        raise ValueError(f"Unknown mask format '{mask_format}', expected one of {MASK_FORMATS}")
+    _check_tiling(tile, overlap)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = sorted(e.path for e in os.scandir(input_dir) if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS))
+
+    model = build_tta(model.to(device).eval(), tta)
+    autocast = torch.autocast(device_type=device.type, dtype=torch.bfloat16) if precision == 'bf16' else contextlib.nullcontext()
+    decoded, written = collections.deque(), collections.deque()
+    pending_paths = iter(paths)
+    start, count = time.perf_counter(), 0
+
+    with ThreadPoolExecutor(num_workers) as decoders, ThreadPoolExecutor(num_workers) as writers, torch.inference_mode():
+        def fill_decode_queue():
+            for path in pending_paths:
+                decoded.append(decoders.submit(_decode_for_inference, path, working_size))
+                if len(decoded) >= prefetch:
+                    break
+
+        fill_decode_queue()
+        while decoded:
+            group = [decoded.popleft().result() for _ in range(min(group_size, len(decoded)))]
+            fill_decode_queue()
+
+            images = [normalize_images(image[None].to(device))[0] for _, _, image in group]
+            with autocast:
+                prob_maps = tiled_predict(model, images, tile=tile, overlap=overlap, batch_size=batch_size)
+
+            for (path, original_size, _), probs in zip(group, prob_maps):
+                probs = F.interpolate(probs[None, None], size=original_size, mode='bilinear', align_corners=False)[0, 0]
+                packed = pack_masks(probs, threshold).cpu().numpy()  # 1/32 of the float map crosses to the host
+                out_base = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0])
+                written.append(writers.submit(_write_mask, packed, original_size, out_base, mask_format))
+                while len(written) > prefetch:
+                    written.popleft().result()
+                count += 1
+
+        for future in written:
+            future.result()
+
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {count} masks to {output_dir} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.2f} images/s)")
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiled lesion segmentation of a directory of images.")
+    parser.add_argument('--weights', required=True, help="EncoderDecoder state_dict saved with torch.save")
+    parser.add_argument('--input-dir', required=True)
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--num-classes', type=int, default=1)
+    parser.add_argument('--decoder', choices=list(DECODER_VARIANTS), default='baseline')
+    parser.add_argument('--tile', type=int, default=128)
+    parser.add_argument('--overlap', type=int, default=32)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--working-size', type=int, default=128, help="0 tiles the full-resolution image")
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--prefetch', type=int, default=16)
+    parser.add_argument('--precision', choices=['fp32', 'bf16'], default='fp32')
+    parser.add_argument('--mask-format', choices=MASK_FORMATS, default='png')
+    parser.add_argument('--tta', choices=list(TTA_CONFIGS), default='none')
+    args = parser.parse_args(argv)
+
+    model = build_encoder_decoder(args.num_classes, weights_path=args.weights, decoder=args.decoder)
+    return run_directory_inference(
+        model, args.input_dir, args.output_dir, tile=args.tile, overlap=args.overlap, batch_size=args.batch_size,
+        working_size=args.working_size or None, threshold=args.threshold, num_workers=args.workers,
+        prefetch=args.prefetch, precision=args.precision, mask_format=args.mask_format, tta=args.tta
+    )
+
+if __name__ == "__main__":
+    main()
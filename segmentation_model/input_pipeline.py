@@ -0,0 +1,51 @@
+"""Configurable DataLoader input pipeline.
+
+`INPUT_PIPELINES` names DataLoader settings (worker processes, batches prefetched per worker,
+pinned host memory, persistent workers) together with whether host-to-device copies are issued
+non-blocking, so they overlap with compute on CUDA. `loader_kwargs` turns a pipeline into
+DataLoader keyword arguments; `benchmark_input_pipeline` in `benchmarks` compares pipelines.
+"""
+
+import os
+
+from .devices import device
+
+# name -> pipeline settings; num_workers=None starts one worker per spare core, at most 8
+INPUT_PIPELINES = {
+    'default': {'num_workers': 0, 'prefetch_factor': None, 'pin_memory': False, 'persistent_workers': False, 'non_blocking': False},
+    'workers': {'num_workers': None, 'prefetch_factor': 2, 'pin_memory': False, 'persistent_workers': True, 'non_blocking': False},
+    'pinned': {'num_workers': None, 'prefetch_factor': 4, 'pin_memory': True, 'persistent_workers': True, 'non_blocking': True}
+}
+
+def default_num_workers():
+    # One core stays with the training process
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    return max(0, min(cpus - 1, 8))
+
+def resolve_pipeline(pipeline=None, **overrides):
+    """
+    Complete settings of a pipeline.
+
+    Args:
+        pipeline (str or dict, optional): INPUT_PIPELINES name or settings dict; missing keys
+            take the 'default' values.
+        **overrides: Settings replacing those of `pipeline`, e.g. num_workers=2.
+    """
+    settings = dict(INPUT_PIPELINES['default'])
+    settings.update(INPUT_PIPELINES[pipeline] if isinstance(pipeline, str) else (pipeline or {}))
+    settings.update(overrides)
+    if settings['num_workers'] is None:
+        settings['num_workers'] = default_num_workers()
+    # Pinned pages only speed up copies to a CUDA device
+    settings['pin_memory'] = settings['pin_memory'] and device.type == 'cuda'
+    return settings
+
+def loader_kwargs(pipeline=None, **overrides):
+    """DataLoader keyword arguments of a pipeline; the worker-only options are left out without workers."""
+    settings = resolve_pipeline(pipeline, **overrides)
+    kwargs = {'num_workers': settings['num_workers'], 'pin_memory': settings['pin_memory']}
+    if settings['num_workers'] > 0:
+        kwargs['persistent_workers'] = settings['persistent_workers']
+        if settings['prefetch_factor'] is not None:
+            kwargs['prefetch_factor'] = settings['prefetch_factor']
+    return kwargs
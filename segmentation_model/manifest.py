@@ -0,0 +1,244 @@
+"""Persistent image/mask manifest for ISIC-style directories.
+
+Images are joined to masks by file stem instead of by `os.listdir` position, and the file
+sizes, modification times and pixel dimensions are cached in a JSON manifest kept in a user
+cache directory, so dataset mounts are only read. Reopening a manifest of unchanged
+directories costs two directory stats; only files that were added or changed since the last
+build are read again.
+"""
+
+import hashlib
+import json
+import os
+import random
+import warnings
+
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+MANIFEST_VERSION = 1
+
+def default_manifest_path(image_dir, mask_dir):
+    """Manifest file of a directory pair under $XDG_CACHE_HOME (default ~/.cache), outside the data."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache")
+    key = hashlib.sha1(f"{os.path.abspath(image_dir)}\n{os.path.abspath(mask_dir)}".encode()).hexdigest()[:16]
+    return os.path.join(cache_home, "segmentation_model", "manifests", f"{key}.json")
+
+def _scan(directory, previous):
+    """Returns {file name: entry} for the images in `directory`, reusing unchanged entries of `previous`."""
+    entries = {}
+    with os.scandir(directory) as it:
+        for e in it:
+            if not e.is_file() or not e.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            stat = e.stat()
+            old = previous.get(e.name)
+            if old is not None and old['bytes'] == stat.st_size and old['mtime'] == stat.st_mtime:
+                entries[e.name] = old
+                continue
+            with Image.open(e.path) as image:  # Only the header is read
+                width, height = image.size
+            entries[e.name] = {'bytes': stat.st_size, 'mtime': stat.st_mtime, 'width': width, 'height': height}
+    return entries
+
+def _join_key(name, suffix):
+    stem = os.path.splitext(name)[0]
+    if suffix and stem.endswith(suffix):
+        stem = stem[:-len(suffix)]
+    return stem
+
+class ManifestView():
+    def __init__(self, manifest, indices):
+        """
+        A cheap ordered selection of manifest records; indexing it is O(1).
+
+        Args:
+            manifest (DatasetManifest): The manifest holding the records.
+            indices (list): Positions of the selected records in `manifest.records`.
+        """
+        self.manifest = manifest
+        self.indices = list(indices)
+
+    @property
+    def ids(self):
+        return [self.manifest.records[i]['id'] for i in self.indices]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        return self.manifest.records[self.indices[i]]
+
+    def __iter__(self):
+        return (self.manifest.records[i] for i in self.indices)
+
+    def image_paths(self):
+        return [os.path.join(self.manifest.image_dir, r['image']) for r in self]
+
+    def mask_paths(self):
+        return [os.path.join(self.manifest.mask_dir, r['mask']) for r in self]
+
+    def subset(self, ids):
+        """View of the records with the given IDs, in the given order."""
+        return ManifestView(self.manifest, [self.manifest.index_of(i) for i in ids])
+
+    def filter(self, predicate):
+        """View of the records for which `predicate(record)` is true."""
+        return ManifestView(self.manifest, [i for i in self.indices if predicate(self.manifest.records[i])])
+
+    def stratified_split(self, fractions, key=None, seed=0):
+        """
+        Splits the view into len(fractions) views, keeping the distribution of `key(record)`
+        (by default the image resolution) close to identical in every part.
+        """
+        key = key if key is not None else (lambda record: (record['width'], record['height']))
+        groups = {}
+        for i in self.indices:
+            groups.setdefault(key(self.manifest.records[i]), []).append(i)
+
+        rng = random.Random(seed)
+        total = sum(fractions)
+        group_keys = sorted(groups, key=repr)
+        for group_key in group_keys:
+            rng.shuffle(groups[group_key])
+
+        # Part sizes over the whole view, then largest-remainder allocation of every part's share
+        # across the groups, so groups too small to split on their own still fill the small parts
+        bounds = [round(len(self.indices) * sum(fractions[:k + 1]) / total) for k in range(len(fractions))]
+        part_left = [end - start for start, end in zip([0] + bounds[:-1], bounds)]
+        counts, remainders = {}, []
+        for group_key in group_keys:
+            quotas = [len(groups[group_key]) * fraction / total for fraction in fractions]
+            counts[group_key] = [int(q) for q in quotas]
+            for k, q in enumerate(quotas):
+                part_left[k] -= int(q)
+                remainders.append((q - int(q), rng.random(), group_key, k))
+
+        group_left = {g: len(groups[g]) - sum(counts[g]) for g in group_keys}
+        for _, _, group_key, k in sorted(remainders, key=lambda r: (-r[0], r[1])):
+            if group_left[group_key] > 0 and part_left[k] > 0:
+                counts[group_key][k] += 1
+                group_left[group_key] -= 1
+                part_left[k] -= 1
+        for group_key in group_keys:
+            while group_left[group_key] > 0:  # Only left when the remainders of a group were all taken
+                k = max(range(len(fractions)), key=lambda k: part_left[k])
+                counts[group_key][k] += 1
+                group_left[group_key] -= 1
+                part_left[k] -= 1
+
+        parts = [[] for _ in fractions]
+        for group_key in group_keys:
+            start = 0
+            for part, count in zip(parts, counts[group_key]):
+                part.extend(groups[group_key][start:start + count])
+                start += count
+        return [ManifestView(self.manifest, sorted(part)) for part in parts]
+
+class DatasetManifest(ManifestView):
+    def __init__(self, image_dir, mask_dir, path=None, mask_suffix="_Segmentation", refresh=True):
+        """
+        Args:
+            image_dir (str): Directory containing the images.
+            mask_dir (str): Directory containing the masks.
+            path (str, optional): Manifest file; defaults to `default_manifest_path`. If it cannot be
+                written, the manifest is kept in memory only.
+            mask_suffix (str): Stripped from mask stems before joining, so `ISIC_0000000_Segmentation.png`
+                pairs with `ISIC_0000000.jpg`. Masks named exactly like their image pair as well.
+            refresh (bool): Rescan if files were added, removed or renamed since the manifest was written.
+                False trusts an existing manifest as is and never touches a slow remote mount. Files
+                overwritten in place keep the directory mtime; delete the manifest to pick those up.
+        """
+        self.image_dir = image_dir
+        self.mask_dir = mask_dir
+        self.path = path if path is not None else default_manifest_path(image_dir, mask_dir)
+        self.mask_suffix = mask_suffix
+
+        state = self._load()
+        if state is None or refresh:
+            state = self._refresh(state)
+        self._build_records(state)
+        super(DatasetManifest, self).__init__(self, range(len(self.records)))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get('version') != MANIFEST_VERSION or state.get('mask_suffix') != self.mask_suffix:
+            return None
+        return state
+
+    def _dir_mtimes(self):
+        return [os.stat(self.image_dir).st_mtime, os.stat(self.mask_dir).st_mtime]
+
+    def _refresh(self, state):
+        dir_mtimes = self._dir_mtimes()
+        if state is not None and state['dir_mtimes'] == dir_mtimes:
+            return state  # No file was added, removed or renamed
+
+        previous = state if state is not None else {'images': {}, 'masks': {}}
+        refreshed = {
+            'version': MANIFEST_VERSION,
+            'mask_suffix': self.mask_suffix,
+            'dir_mtimes': dir_mtimes,
+            'images': _scan(self.image_dir, previous['images']),
+            'masks': _scan(self.mask_dir, previous['masks'])
+        }
+        if refreshed != state:
+            self._write(refreshed)
+        return refreshed
+
+    def _write(self, state):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"  # Several ranks may refresh the same manifest
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+
+            dir_mtimes = self._dir_mtimes()
+            if dir_mtimes != state['dir_mtimes']:
+                # The manifest lives in a scanned directory, whose mtime the rename just changed.
+                # Overwriting the now existing file in place leaves the directory mtime alone.
+                state['dir_mtimes'] = dir_mtimes
+                with open(self.path, 'w') as f:
+                    json.dump(state, f)
+        except OSError as e:
+            warnings.warn(f"Could not write the manifest to {self.path} ({e}); keeping it in memory only")
+
+    def _build_records(self, state):
+        masks = {_join_key(name, self.mask_suffix): name for name in state['masks']}
+        images = {os.path.splitext(name)[0]: name for name in state['images']}
+
+        self.records = []
+        for stem in sorted(images.keys() & masks.keys()):
+            image, mask = state['images'][images[stem]], state['masks'][masks[stem]]
+            self.records.append({
+                'id': stem,
+                'image': images[stem],
+                'mask': masks[stem],
+                'width': image['width'],
+                'height': image['height'],
+                'image_bytes': image['bytes'],
+                'mask_bytes': mask['bytes'],
+                'mask_width': mask['width'],
+                'mask_height': mask['height']
+            })
+        self._by_id = {record['id']: i for i, record in enumerate(self.records)}
+
+        self.missing_masks = sorted(images.keys() - masks.keys())
+        self.orphan_masks = sorted(masks.keys() - images.keys())
+        if self.missing_masks or self.orphan_masks:
+            warnings.warn(f"{len(self.missing_masks)} images without a mask and {len(self.orphan_masks)} masks "
+                          f"without an image in {self.image_dir}; they are left out of the manifest")
+
+    def index_of(self, record_id):
+        return self._by_id[record_id]
+
+    def get(self, record_id):
+        return self.records[self._by_id[record_id]]
+
+    def __contains__(self, record_id):
+        return record_id in self._by_id
@@ -0,0 +1,99 @@
+"""Compact binary mask formats.
+
+Lesion masks are binary, so storing or moving them as uint8 (or float32) wastes 8x (or 32x)
+the space. `pack_masks` keeps one bit per pixel along the last axis, in the same layout as
+`np.packbits`, and works on numpy arrays and on tensors of any device; `rle_encode` stores
+the run lengths of a mask for output files.
+"""
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+MASK_FORMATS = ('png', 'packbits', 'rle')
+
+def _default_threshold(masks):
+    # uint8 masks are 0/255 (with resampled edges), everything else is in [0, 1]
+    return 127 if masks.dtype in (np.uint8, torch.uint8) else 0.5
+
+def pack_masks(masks, threshold=None):
+    """
+    Binarizes `masks` of shape (..., H, W) and packs them to (..., H, ceil(W / 8)) uint8, most
+    significant bit first.
+    """
+    threshold = threshold if threshold is not None else _default_threshold(masks)
+    if isinstance(masks, np.ndarray):
+        return np.packbits(masks > threshold, axis=-1)
+
+    bits = (masks > threshold).to(torch.uint8)
+    if bits.shape[-1] % 8:
+        bits = F.pad(bits, (0, -bits.shape[-1] % 8))
+    shifts = torch.arange(7, -1, -1, dtype=torch.uint8, device=bits.device)
+    return (bits.unflatten(-1, (-1, 8)) << shifts).sum(-1, dtype=torch.uint8)
+
+class PackMasks():
+    """`pack_masks` as a per-sample transform, with a repr that is stable across processes."""
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold
+
+    def __call__(self, masks):
+        return pack_masks(masks, self.threshold)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(threshold={self.threshold})"
+
+def unpack_masks(packed, width, dtype=torch.float32):
+    """Inverse of `pack_masks`: (..., H, ceil(W / 8)) uint8 to (..., H, width) 0/1 values of `dtype`."""
+    if isinstance(packed, np.ndarray):
+        return np.unpackbits(packed, axis=-1, count=width)
+
+    shifts = torch.arange(7, -1, -1, dtype=torch.uint8, device=packed.device)
+    bits = (packed.unsqueeze(-1) >> shifts) & 1
+    return bits.flatten(-2)[..., :width].to(dtype)
+
+def is_packed(masks, width):
+    """True if the uint8 `masks` hold bit-packed rows of images `width` pixels wide."""
+    return masks.dtype in (np.uint8, torch.uint8) and masks.shape[-1] != width and masks.shape[-1] == -(-width // 8)
+
+def rle_encode(mask):
+    """
+    Run lengths of a binary (H, W) mask in row-major order, alternating background and
+    foreground and starting with a (possibly empty) background run. Nonzero is foreground.
+    """
+    if torch.is_tensor(mask):
+        mask = mask.detach().cpu().numpy()
+    flat = np.asarray(mask).reshape(-1) > 0
+
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate([[0], changes, [flat.size]]))
+    if flat.size and flat[0]:
+        counts = np.concatenate([[0], counts])
+    return {'size': list(mask.shape), 'counts': counts.tolist()}
+
+def rle_decode(rle):
+    """Inverse of `rle_encode`, as a 0/1 uint8 array."""
+    counts = np.asarray(rle['counts'], dtype=np.int64)
+    values = (np.arange(len(counts)) % 2).astype(np.uint8)
+    return np.repeat(values, counts).reshape(rle['size'])
+
+def mask_format_report(masks):
+    """Prints the size of a batch of (..., H, W) masks as float32, uint8, bit-packed and RLE."""
+    if torch.is_tensor(masks):
+        masks = masks.detach().cpu().numpy()
+    masks = np.asarray(masks)
+    binary = masks > _default_threshold(masks)
+    flat = binary.reshape(-1, *binary.shape[-2:])
+
+    sizes = {
+        'float32': binary.size * 4,
+        'uint8': binary.size,
+        'packbits': pack_masks(binary.astype(np.uint8), threshold=0).nbytes,
+        # 4 bytes per run, as written by an int32 array
+        'rle': sum(len(rle_encode(m)['counts']) * 4 for m in flat)
+    }
+
+    print(f"{'Format':<10} {'Bytes':>12} {'vs float32':>11}")
+    for name, size in sizes.items():
+        print(f"{name:<10} {size:>12} {sizes['float32'] / max(size, 1):>10.1f}x")
+    return sizes
@@ -0,0 +1,103 @@
+"""Streaming IoU/Dice metrics."""
+
+import torch
+import torch.distributed as dist
+
+class SegmentationMetrics():
+    def __init__(self, thresholds=(0.5,), eps=1e-6):
+        """
+        Streaming IoU/Dice accumulator. Running totals stay on the device of the
+        predictions and are only copied to the host by `compute()`.
+
+        Args:
+            thresholds (tuple): Thresholds for the binarized variants, next to the soft metrics.
+            eps (float): Smoothing term of the ratios.
+        """
+        self.thresholds = tuple(thresholds)
+        self.eps = eps
+        self.reset()
+
+    def reset(self):
+        # Rows: per-image IoU sum, per-image Dice sum, intersection, union, |P| + |G|
+        self.totals = None
+        self.loss_sum = None
+        self.num_images = 0
+        self.num_batches = 0
+
+    def batch_scores(self, predictions, targets):
+        """Returns per-image (IoU, Dice), each of shape (variants, batch); variant 0 is soft."""
+        predictions = predictions.detach().flatten(1).float()
+        targets = targets.detach().flatten(1).float()
+
+        variants = [predictions] + [(predictions > t).float() for t in self.thresholds]
+        variants = torch.stack(variants)
+
+        intersection = (variants * targets).sum(-1)
+        denominator = variants.sum(-1) + targets.sum(-1)
+        union = denominator - intersection
+
+        iou = intersection / (union + self.eps)
+        dice = (2 * intersection) / (denominator + self.eps)
+        return iou, dice, intersection, union, denominator
+
+    def update(self, predictions, targets, loss=None):
+        iou, dice, intersection, union, denominator = self.batch_scores(predictions, targets)
+        batch_totals = torch.stack([iou.sum(-1), dice.sum(-1), intersection.sum(-1), union.sum(-1), denominator.sum(-1)])
+
+        self.totals = batch_totals if self.totals is None else self.totals + batch_totals
+        if loss is not None:
+            loss = loss.detach().float()
+            self.loss_sum = loss if self.loss_sum is None else self.loss_sum + loss
+            self.num_batches += 1
+        self.num_images += predictions.size(0)
+
+    def state_dict(self):
+        return {'totals': self.totals, 'loss_sum': self.loss_sum, 'num_images': self.num_images, 'num_batches': self.num_batches}
+
+    def load_state_dict(self, state, device=None):
+        """Restores running totals, e.g. from a mid-epoch checkpoint, optionally moving them to `device`."""
+        move = lambda t: t.to(device) if t is not None and device is not None else t
+        self.totals = move(state['totals'])
+        self.loss_sum = move(state['loss_sum'])
+        self.num_images = state['num_images']
+        self.num_batches = state['num_batches']
+
+    def all_reduce(self):
+        """Sums the running totals over the default process group, so every rank sees global metrics."""
+        loss_sum = self.loss_sum if self.loss_sum is not None else self.totals.new_zeros(())
+        packed = torch.cat([
+            self.totals.flatten(),
+            loss_sum.view(1),
+            self.totals.new_tensor([self.num_images, self.num_batches])
+        ])
+        dist.all_reduce(packed)
+
+        n = self.totals.numel()
+        self.totals = packed[:n].view_as(self.totals)
+        if self.loss_sum is not None:
+            self.loss_sum = packed[n]
+        self.num_images = int(packed[n + 1].item())
+        self.num_batches = int(packed[n + 2].item())
+
+    def compute(self):
+        if self.totals is None:
+            raise ValueError("compute() called before any update()")
+
+        values = self.totals
+        if self.loss_sum is not None:
+            values = torch.cat([values.flatten(), self.loss_sum.view(1)])
+        values = values.flatten().tolist()  # The only host sync
+
+        rows = len(self.thresholds) + 1
+        iou_sum, dice_sum, intersection, union, denominator = [values[i * rows:(i + 1) * rows] for i in range(5)]
+
+        results = {}
+        for i, suffix in enumerate([""] + [f"@{t:g}" for t in self.thresholds]):
+            results['iou' + suffix] = iou_sum[i] / self.num_images
+            results['dice' + suffix] = dice_sum[i] / self.num_images
+            results['global_iou' + suffix] = intersection[i] / (union[i] + self.eps)
+            results['global_dice' + suffix] = (2 * intersection[i]) / (denominator[i] + self.eps)
+        if self.loss_sum is not None:
+            results['loss'] = values[-1] / self.num_batches
+        results['num_images'] = self.num_images
+        return results
@@ -0,0 +1,222 @@
+"""MobileNetV2 encoder-decoder segmentation models.
+
+`ConfigurableDecoder` replaces the full 3x3 convolutions of `MobileNetDecoder` with optional
+depthwise-separable blocks and pixel-shuffle upsampling. Every variant keeps the 32x upsampling
+of the encoder stride and returns logits.
+
+Activation checkpointing (`EncoderDecoder.set_activation_checkpointing`) keeps only the inputs
+of each MobileNetV2 block and decoder stage during the forward pass and recomputes the rest
+in backward, which is what makes 384-512px fine-tuning fit.
+"""
+
+import contextlib
+
+import torch
+import torch.nn as nn
+import torch.utils.checkpoint
+import torchvision.models as models
+
+@contextlib.contextmanager
+def _frozen_batchnorm_stats(module):
+    # Running statistics are not read in training mode, so restoring them keeps the outputs identical
+    norms = [m for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm) and m.training and m.track_running_stats]
+    saved = [(m.running_mean.clone(), m.running_var.clone(), m.num_batches_tracked.clone()) for m in norms]
+    try:
+        yield
+    finally:
+        for m, (mean, var, count) in zip(norms, saved):
+            m.running_mean.copy_(mean)
+            m.running_var.copy_(var)
+            m.num_batches_tracked.copy_(count)
+
+def _maybe_checkpoint(enabled, fn, *args):
+    # Recomputing only pays off when a backward pass will follow
+    if enabled and torch.is_grad_enabled():
+        calls = []
+
+        def run(*inputs):
+            if not calls:
+                calls.append(True)
+                return fn(*inputs)
+            # Recomputation in backward: BatchNorm must not count the batch a second time
+            with _frozen_batchnorm_stats(fn if isinstance(fn, nn.Module) else fn.__self__):
+                return fn(*inputs)
+        return torch.utils.checkpoint.checkpoint(run, *args, use_reentrant=False)
+    return fn(*args)
+
+class MobileNetDecoder(nn.Module):
+    def __init__(self, in_channels, num_classes):
+        super(MobileNetDecoder, self).__init__()
+
+        self.up1 = nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True)
+        self.conv1 = nn.Conv2d(in_channels, 64, kernel_size=3, padding=1)
+        self.bn1 = nn.BatchNorm2d(64)
+        self.relu1 = nn.LeakyReLU(inplace=True)
+
+        self.up2 = nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True)
+        self.conv2 = nn.Conv2d(64, 32, kernel_size=3, padding=1)
+        self.bn2 = nn.BatchNorm2d(32)
+        self.relu2 = nn.LeakyReLU(inplace=True)
+
+        self.up3 = nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True)
+        self.conv3 = nn.Conv2d(32, 16, kernel_size=3, padding=1)
+        self.bn3 = nn.BatchNorm2d(16)
+        self.relu3 = nn.LeakyReLU(inplace=True)
+
+        self.up4 = nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True)
+        self.conv4 = nn.Conv2d(16, 8, kernel_size=3, padding=1)
+        self.bn4 = nn.BatchNorm2d(8)
+        self.relu4 = nn.LeakyReLU(inplace=True)
+
+        self.up5 = nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True)
+        self.conv5 = nn.Conv2d(8, 1, kernel_size=3, padding=1)
+        self.dropout = nn.Dropout(p=0.5)
+        self.checkpoint_activations = False
+
+    def _stage1(self, x):
+        return self.relu1(self.bn1(self.conv1(self.up1(x))))
+
+    def _stage2(self, x):
+        return self.relu2(self.bn2(self.conv2(self.up2(x))))
+
+    def _stage3(self, x):
+        return self.relu3(self.bn3(self.conv3(self.up3(x))))
+
+    def _stage4(self, x):
+        return self.relu4(self.bn4(self.conv4(self.up4(x))))
+
+    def _head(self, x):
+        return self.conv5(self.up5(x))  # Logits; EncoderDecoder applies the sigmoid
+
+    def forward(self, x):
+        for stage in (self._stage1, self._stage2, self._stage3, self._stage4, self._head):
+            x = _maybe_checkpoint(self.checkpoint_activations, stage, x)
+        return x
+
+def _conv_block(in_channels, out_channels, block):
+    if block == 'conv':
+        return nn.Sequential(
+            nn.Conv2d(in_channels, out_channels, kernel_size=3, padding=1, bias=False),
+            nn.BatchNorm2d(out_channels),
+            nn.LeakyReLU(inplace=True)
+        )
+    if block == 'dwsep':
+        return nn.Sequential(
+            nn.Conv2d(in_channels, in_channels, kernel_size=3, padding=1, groups=in_channels, bias=False),
+            nn.BatchNorm2d(in_channels),
+            nn.LeakyReLU(inplace=True),
+            nn.Conv2d(in_channels, out_channels, kernel_size=1, bias=False),
+            nn.BatchNorm2d(out_channels),
+            nn.LeakyReLU(inplace=True)
+        )
+    raise ValueError(f"Unknown block '{block}', expected 'conv' or 'dwsep'")
+
+class ConfigurableDecoder(nn.Module):
+    def __init__(self, in_channels, num_classes, widths=(64, 32, 16, 8), block='conv', upsample='bilinear', dropout=0.0):
+        """
+        Args:
+            in_channels (int): Channels of the encoder features (1280 for MobileNetV2).
+            num_classes (int): Output channels.
+            widths (tuple): Channels after each of the four upsampling stages.
+            block (str): 'conv' (3x3 Conv-BN-LeakyReLU) or 'dwsep' (depthwise 3x3 + pointwise 1x1).
+            upsample (str): 'bilinear' (upsample, then convolve at the higher resolution) or
+                'pixel_shuffle' (convolve to 4x the channels at the lower resolution, then shuffle).
+            dropout (float): Dropout2d probability after the first stage.
+        """
+        super(ConfigurableDecoder, self).__init__()
+        if len(widths) != 4:
+            raise ValueError("widths must have 4 entries so the decoder upsamples by the encoder stride of 32")
+        if upsample not in ('bilinear', 'pixel_shuffle'):
+            raise ValueError(f"Unknown upsample '{upsample}', expected 'bilinear' or 'pixel_shuffle'")
+
+        stages = []
+        channels = in_channels
+        for i, width in enumerate(widths):
+            if upsample == 'bilinear':
+                stages.append(nn.Sequential(nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True), _conv_block(channels, width, block)))
+            else:
+                stages.append(nn.Sequential(_conv_block(channels, width * 4, block), nn.PixelShuffle(2)))
+            if i == 0 and dropout > 0:
+                stages.append(nn.Dropout2d(p=dropout))
+            channels = width
+        self.stages = nn.Sequential(*stages)
+
+        if upsample == 'bilinear':
+            self.head = nn.Sequential(nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True), nn.Conv2d(channels, num_classes, kernel_size=3, padding=1))
+        else:
+            self.head = nn.Sequential(nn.Conv2d(channels, num_classes * 4, kernel_size=3, padding=1), nn.PixelShuffle(2))
+        self.checkpoint_activations = False
+
+    def forward(self, x):
+        for stage in self.stages:
+            x = _maybe_checkpoint(self.checkpoint_activations, stage, x)
+        return _maybe_checkpoint(self.checkpoint_activations, self.head, x)
+
+DECODER_VARIANTS = {
+    'baseline': lambda in_channels, num_classes: MobileNetDecoder(in_channels=in_channels, num_classes=num_classes),
+    'conv-bilinear': lambda in_channels, num_classes: ConfigurableDecoder(in_channels, num_classes),
+    'dwsep-bilinear': lambda in_channels, num_classes: ConfigurableDecoder(in_channels, num_classes, block='dwsep'),
+    'dwsep-pixel_shuffle': lambda in_channels, num_classes: ConfigurableDecoder(in_channels, num_classes, block='dwsep', upsample='pixel_shuffle'),
+    'dwsep-pixel_shuffle-slim': lambda in_channels, num_classes: ConfigurableDecoder(in_channels, num_classes, widths=(32, 16, 8, 8), block='dwsep', upsample='pixel_shuffle'),
+    'dwsep-bilinear-wide': lambda in_channels, num_classes: ConfigurableDecoder(in_channels, num_classes, widths=(128, 64, 32, 16), block='dwsep')
+}
+
+def build_decoder(name, in_channels=1280, num_classes=1):
+    return DECODER_VARIANTS[name](in_channels, num_classes)
+
+class EncoderDecoder(nn.Module):
+    def __init__(self, mobilenet, decoder):
+        super(EncoderDecoder, self).__init__()
+        self.mobilenet = mobilenet
+        self.decoder = decoder
+        self.checkpoint_activations = False
+
+    def set_activation_checkpointing(self, enabled=True):
+        """Recompute block activations in backward instead of storing them, in the encoder and the decoder."""
+        self.checkpoint_activations = enabled
+        if hasattr(self.decoder, 'checkpoint_activations'):
+            self.decoder.checkpoint_activations = enabled
+        return self
+
+    def encode(self, x):
+        if not self.checkpoint_activations:
+            return self.mobilenet.features(x)
+        # One segment per inverted-residual block (plus the stem and the final 1x1 conv)
+        for block in self.mobilenet.features:
+            x = _maybe_checkpoint(True, block, x)
+        return x
+
+    def decode(self, features):
+        return self.decoder(features)
+
+    def forward(self, x, return_logits=False):
+        x = self.encode(x)
+        x = self.decode(x)
+        if return_logits:
+            return x
+        return torch.sigmoid(x)
+
+def build_encoder_decoder(num_classes=1, weights_path=None, pretrained_encoder=True, decoder='baseline'):
+    weights = models.MobileNet_V2_Weights.IMAGENET1K_V1 if pretrained_encoder and weights_path is None else None
+    model = EncoderDecoder(models.mobilenet_v2(weights=weights), build_decoder(decoder, 1280, num_classes))
+    if weights_path is not None:
+        model.load_state_dict(torch.load(weights_path, map_location='cpu'))
+    return model
+
+def count_conv_flops(module, input_shape):
+    """FLOPs (2 x multiply-accumulates) of all convolutions for one input of shape (C, H, W)."""
+    flops = []
+
+    def hook(conv, inputs, output):
+        kernel_ops = (conv.in_channels // conv.groups) * conv.kernel_size[0] * conv.kernel_size[1]
+        flops.append(2 * kernel_ops * output[0].numel())
+
+    handles = [m.register_forward_hook(hook) for m in module.modules() if isinstance(m, nn.Conv2d)]
+    was_training = module.training
+    module.eval()
+    with torch.no_grad():
+        module(torch.zeros(1, *input_shape, device=next(module.parameters()).device))
+    module.train(was_training)
+    for handle in handles:
+        handle.remove()
+    return sum(flops)
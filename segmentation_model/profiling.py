@@ -0,0 +1,184 @@
+"""Per-stage hot-path profiling of the training loop.
+
+`StepProfiler` records the wall time of each stage of every training step (data-loader wait,
+host-to-device transfer, batch augmentation, forward, backward, optimizer step, metrics) and of
+the per-epoch work (validation, plotting), together with peak memory: the CUDA allocator peak,
+or on CPU the peak resident size of the whole process. With `num_workers=0` the data-loader wait
+is the `ISICDataset` decode and transform time; with workers it is the time the step stalled on
+them. An optional `torch.profiler` trace covers a window of steps.
+"""
+
+import contextlib
+import csv
+import json
+import os
+import resource
+import time
+
+import numpy as np
+import torch
+
+STEP_STAGES = ('data_wait', 'transfer', 'augment', 'forward', 'backward', 'optimizer', 'metrics')
+
+class NullProfiler():
+    """Stand-in used when profiling is off; every hook is a no-op."""
+
+    def iterate(self, loader):
+        return iter(loader)
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def step(self):
+        pass
+
+    def epoch_end(self, epoch):
+        pass
+
+    def close(self):
+        pass
+
+class StepProfiler():
+    def __init__(self, sync=True, trace_dir=None, trace_steps=(10, 20)):
+        """
+        Args:
+            sync (bool): Synchronize CUDA at stage boundaries so asynchronous kernels are charged
+                to the stage that launched them. Has no effect on CPU.
+            trace_dir (str, optional): Write a `torch.profiler` Chrome trace of `trace_steps` here.
+            trace_steps (tuple): Half-open [start, stop) window of global steps to trace.
+        """
+        self.sync = sync and torch.cuda.is_available()
+        self.trace_dir = trace_dir
+        self.trace_steps = trace_steps
+        self.steps = []
+        self.epochs = []
+        self._current = {}
+        self._torch_profiler = None
+
+    def _synchronize(self):
+        if self.sync:
+            torch.cuda.synchronize()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._synchronize()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._synchronize()
+            self._current[name] = self._current.get(name, 0.0) + time.perf_counter() - start
+
+    def iterate(self, loader):
+        """Yields the batches of `loader`, charging the time spent waiting for each to 'data_wait'."""
+        iterator = iter(loader)
+        while True:
+            self._maybe_trace()
+            start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self._current['data_wait'] = self._current.get('data_wait', 0.0) + time.perf_counter() - start
+            yield batch
+
+    def _maybe_trace(self):
+        if self.trace_dir is None:
+            return
+        step = len(self.steps)
+        if step == self.trace_steps[0] and self._torch_profiler is None:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._torch_profiler = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+            self._torch_profiler.__enter__()
+        elif step == self.trace_steps[1]:
+            self._stop_trace()
+
+    def _stop_trace(self):
+        """Closes an open trace window and exports the steps it covered."""
+        if self._torch_profiler is None:
+            return
+        self._torch_profiler.__exit__(None, None, None)
+        os.makedirs(self.trace_dir, exist_ok=True)
+        self._torch_profiler.export_chrome_trace(os.path.join(self.trace_dir, f"trace_steps_{self.trace_steps[0]}_{len(self.steps)}.json"))
+        self._torch_profiler = None
+
+    def step(self):
+        record = {name: self._current.get(name, 0.0) for name in STEP_STAGES}
+        record['total'] = sum(record.values())
+        self.steps.append(record)
+        self._current = {}
+
+    def epoch_end(self, epoch):
+        # A window reaching past the last step of the epoch is cut here rather than left open
+        self._stop_trace()
+        record = dict(self._current, epoch=epoch, **self.peak_memory())
+        self.epochs.append(record)
+        self._current = {}
+
+    def close(self):
+        """Exports a trace window still open when training stops early."""
+        self._stop_trace()
+
+    def peak_memory(self):
+        """
+        Peak memory in MB, keyed by what it measures: 'peak_memory_mb' is the CUDA allocator
+        peak, 'process_peak_memory_mb' the resident-set peak of the whole process so far (on CPU).
+        """
+        if torch.cuda.is_available():
+            return {'peak_memory_mb': torch.cuda.max_memory_allocated() / 2 ** 20}
+        return {'process_peak_memory_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}  # KiB on Linux
+
+    def summary(self):
+        """Per-stage count, total, mean and p50/p90/p99/max in milliseconds, plus share of step time."""
+        stages = {}
+        total_time = sum(r['total'] for r in self.steps) or 1e-12
+        for name in STEP_STAGES + ('total',):
+            values = np.array([r[name] for r in self.steps]) * 1000
+            if values.size == 0:
+                continue
+            stages[name] = {
+                'count': int(values.size),
+                'total_ms': float(values.sum()),
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(np.percentile(values, 50)),
+                'p90_ms': float(np.percentile(values, 90)),
+                'p99_ms': float(np.percentile(values, 99)),
+                'max_ms': float(values.max()),
+                'share': float(values.sum() / 1000 / total_time)
+            }
+
+        per_epoch = {}
+        for record in self.epochs:
+            for name, value in record.items():
+                if name not in ('epoch', 'peak_memory_mb', 'process_peak_memory_mb'):
+                    per_epoch.setdefault(name, []).append(1000 * value)
+        return {
+            'steps': stages,
+            'epoch_stages_ms': {name: {'mean_ms': float(np.mean(v)), 'max_ms': float(np.max(v))} for name, v in per_epoch.items()},
+            **self.peak_memory()
+        }
+
+    def save(self, out_dir):
+        """Writes `profile_summary.json` and the per-step timings as `profile_steps.csv`."""
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, "profile_summary.json"), 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        with open(os.path.join(out_dir, "profile_steps.csv"), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['step'] + list(STEP_STAGES) + ['total'])
+            writer.writeheader()
+            for i, record in enumerate(self.steps):
+                writer.writerow(dict(record, step=i))
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"{'Stage':<12}{'Mean ms':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'Share':>8}")
+        for name, s in summary['steps'].items():
+            print(f"{name:<12}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}{s['p90_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['share']:>8.1%}")
+        for name, s in summary['epoch_stages_ms'].items():
+            print(f"{name:<12}{s['mean_ms']:>10.2f} ms per epoch")
+        if 'peak_memory_mb' in summary:
+            print(f"Peak memory: {summary['peak_memory_mb']:.0f} MB")
+        else:
+            print(f"Process peak memory: {summary['process_peak_memory_mb']:.0f} MB")
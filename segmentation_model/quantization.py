@@ -0,0 +1,99 @@
+"""Post-training int8 quantization.
+
+CPU serving path: FX graph-mode static quantization of the whole EncoderDecoder. `prepare_fx`
+fuses Conv+BN(+ReLU) in the encoder and Conv+BN in the decoder before inserting observers,
+which are calibrated on validation batches.
+"""
+
+import copy
+import io
+import time
+
+import torch
+import torch.nn as nn
+
+from .data import normalize_batch
+from .metrics import SegmentationMetrics
+
+def quantize_encoder_decoder(model, calibration_loader, num_calibration_batches=32, backend='x86', batch_transform=normalize_batch):
+    """
+    Args:
+        model (EncoderDecoder): Trained fp32 model; it is copied, not modified.
+        calibration_loader (DataLoader): Batches used to calibrate activation ranges, e.g. isic_val_loader.
+        num_calibration_batches (int): Number of calibration batches.
+        backend (str): Quantized engine, 'x86'/'fbgemm' for servers or 'qnnpack' for ARM.
+        batch_transform (callable): Turns loader batches into model inputs.
+
+    Returns:
+        torch.fx.GraphModule: The int8 model, running on CPU.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    torch.backends.quantized.engine = backend
+    model = copy.deepcopy(serving_graph(model)).cpu().eval()
+
+    batches = iter(calibration_loader)
+    example_inputs = (batch_transform(*next(batches))[0],)
+    prepared = prepare_fx(model, get_default_qconfig_mapping(backend), example_inputs)
+
+    with torch.no_grad():
+        prepared(*example_inputs)
+        for i, (inputs, labels) in enumerate(batches, start=1):
+            if i >= num_calibration_batches:
+                break
+            prepared(batch_transform(inputs, labels)[0])
+
+    return convert_fx(prepared)
+
+def serving_graph(model):
+    """
+    The modules of an EncoderDecoder that serving runs, without the unused ImageNet classifier.
+    A plain Sequential also traces without the return_logits branch of EncoderDecoder.forward.
+    """
+    return nn.Sequential(model.mobilenet.features, model.decoder, nn.Sigmoid())
+
+def _serialized_size(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+def quantization_report(fp32_model, int8_model, loader, batch_transform=normalize_batch, num_batches=None, warmup=2):
+    """
+    Compares CPU latency, serialized size and IoU/Dice of the fp32 and int8 models on `loader`.
+    Both are measured on the same `serving_graph`, so the size ratio compares like with like.
+    """
+    fp32_model = serving_graph(fp32_model.cpu().eval())
+    report = {}
+
+    for name, model in [('fp32', fp32_model), ('int8', int8_model)]:
+        metrics = SegmentationMetrics()
+        timings = []
+        with torch.no_grad():
+            for i, (inputs, labels) in enumerate(loader):
+                if num_batches is not None and i >= num_batches:
+                    break
+                inputs, labels = batch_transform(inputs, labels)
+
+                start = time.perf_counter()
+                outputs = model(inputs)
+                if i >= warmup:
+                    timings.append((time.perf_counter() - start) / inputs.size(0))
+                metrics.update(outputs, labels)
+
+        results = metrics.compute()
+        report[name] = {
+            'latency_ms_per_image': 1000 * sum(timings) / max(len(timings), 1),
+            'size_mb': _serialized_size(model) / 2 ** 20,
+            'iou': results['iou'],
+            'dice': results['dice']
+        }
+
+    print(f"{'Model':<8}{'Latency (ms/img)':>18}{'Size (MB)':>12}{'IoU':>10}{'Dice':>10}")
+    for name, r in report.items():
+        print(f"{name:<8}{r['latency_ms_per_image']:>18.2f}{r['size_mb']:>12.2f}{r['iou']:>10.4f}{r['dice']:>10.4f}")
+    fp32, int8 = report['fp32'], report['int8']
+    print(f"Speed-up: {fp32['latency_ms_per_image'] / max(int8['latency_ms_per_image'], 1e-9):.2f}x, "
+          f"size reduction: {fp32['size_mb'] / int8['size_mb']:.2f}x, "
+          f"IoU change: {int8['iou'] - fp32['iou']:+.4f}, Dice change: {int8['dice'] - fp32['dice']:+.4f}")
+    return report
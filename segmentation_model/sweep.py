@@ -0,0 +1,200 @@
+"""Shared-encoder decoder sweeps.
+
+With a frozen encoder every run of a decoder hyperparameter sweep computes the same encoder
+features, so `DecoderSweepTrainer` trains K decoders side by side: each batch goes through the
+encoder once (or comes from the feature cache) and the features are reused by all K decoders,
+each with its own optimizer, loss and metrics.
+"""
+
+import contextlib
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+
+from .devices import device
+from .metrics import SegmentationMetrics
+from .models import ConfigurableDecoder, EncoderDecoder, build_decoder
+
+def _soft_dice_loss(logits, targets, eps=1.0):
+    probs = torch.sigmoid(logits).flatten(1)
+    targets = targets.flatten(1)
+    intersection = (probs * targets).sum(-1)
+    return (1 - (2 * intersection + eps) / (probs.sum(-1) + targets.sum(-1) + eps)).mean()
+
+# name -> loss(logits, targets); all of them take logits, so they are safe under autocast
+SWEEP_LOSSES = {
+    'bce': F.binary_cross_entropy_with_logits,
+    'dice': _soft_dice_loss,
+    'bce+dice': lambda logits, targets: F.binary_cross_entropy_with_logits(logits, targets) + _soft_dice_loss(logits, targets)
+}
+
+def _sync():
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+class DecoderSweepTrainer():
+    def __init__(self, encoder, configs, train_loader, val_loader=[], num_classes=1, feature_cache=None, batch_transform=None,
+                 train_batch_transform=None, precision='fp32', channels_last=False, selection_metric='dice'):
+        """
+        Args:
+            encoder (nn.Module): Frozen MobileNetV2; only `encoder.features` is used.
+            configs (list): One dict per decoder with the optional keys 'name', 'decoder' (a
+                DECODER_VARIANTS name, default 'baseline', or ConfigurableDecoder kwargs such as
+                {'widths': ..., 'dropout': ...}), 'lr' (default 0.001), 'weight_decay' (default 0.0)
+                and 'loss' (a SWEEP_LOSSES name, default 'bce').
+            train_loader (DataLoader): Training batches; its batch size is also used for the feature cache.
+            val_loader (DataLoader): Validation batches; the best config is selected on them.
+            num_classes (int): Output channels of every decoder.
+            feature_cache (EncoderFeatureCache, optional): Train from cached features instead of
+                running the encoder.
+            batch_transform (callable, optional): Turns collated validation batches into model inputs.
+            train_batch_transform (callable, optional): Same for training batches; defaults to `batch_transform`.
+            precision (str): 'fp32' or 'bf16' autocast.
+            channels_last (bool): Run the encoder on channels_last inputs.
+            selection_metric (str): Validation metric that picks the best config.
+        """
+        if precision not in ('fp32', 'bf16'):
+            raise ValueError(f"Unsupported precision '{precision}', expected 'fp32' or 'bf16'")
+
+        self.encoder = encoder.to(device)
+        self.train_loader = train_loader
+        self.val_loader = val_loader
+        self.feature_cache = feature_cache
+        self.batch_transform = batch_transform
+        self.train_batch_transform = train_batch_transform if train_batch_transform is not None else batch_transform
+        self.precision = precision
+        self.channels_last = channels_last
+        if channels_last:
+            self.encoder = self.encoder.to(memory_format=torch.channels_last)
+        self.selection_metric = selection_metric
+
+        self.configs = []
+        decoders, self.optimizers, self.losses = [], [], []
+        for i, config in enumerate(configs):
+            config = dict({'decoder': 'baseline', 'lr': 0.001, 'weight_decay': 0.0, 'loss': 'bce'}, **config)
+            config.setdefault('name', f"{i}:{config['decoder'] if isinstance(config['decoder'], str) else 'custom'}"
+                                      f"/lr={config['lr']:g}/{config['loss']}")
+            if isinstance(config['decoder'], str):
+                decoder = build_decoder(config['decoder'], 1280, num_classes)
+            else:
+                decoder = ConfigurableDecoder(1280, num_classes, **config['decoder'])
+            decoders.append(decoder)
+            self.optimizers.append(optim.Adam(decoder.parameters(), lr=config['lr'], weight_decay=config['weight_decay']))
+            self.losses.append(SWEEP_LOSSES[config['loss']])
+            self.configs.append(config)
+        self.decoders = nn.ModuleList(decoders).to(device)
+
+        self.history = {c['name']: {'train': [], 'val': []} for c in self.configs}
+        self.timings = {'encoder': 0.0, 'decoders': [0.0] * len(self.configs)}
+        self.best = None
+
+    def autocast(self):
+        if self.precision == 'bf16':
+            return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+
+    def features(self, inputs, labels, batch_transform, cached=False):
+        """Encoder features and float masks of a batch, computed once for all decoders."""
+        if cached:
+            return inputs.to(device), labels.to(device)
+
+        inputs, labels = inputs.to(device), labels.to(device)
+        if batch_transform is not None:
+            inputs, labels = batch_transform(inputs, labels)
+        if self.channels_last:
+            inputs = inputs.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad(), self.autocast():
+            features = self.encoder.features(inputs)
+        return features, labels
+
+    def train(self, epochs):
+        train_loader = self.train_loader
+        if self.feature_cache is not None:
+            train_loader = self.feature_cache.loader(batch_size=self.train_loader.batch_size, shuffle=True)
+        self.encoder.eval()  # Frozen: BN statistics must not drift
+
+        for epoch in range(epochs):
+            self.decoders.train()
+            metrics = [SegmentationMetrics() for _ in self.configs]
+
+            for inputs, labels in train_loader:
+                _sync()
+                start = time.perf_counter()
+                features, labels = self.features(inputs, labels, self.train_batch_transform, cached=self.feature_cache is not None)
+                _sync()
+                self.timings['encoder'] += time.perf_counter() - start
+
+                for k, (decoder, optimizer, loss_fn) in enumerate(zip(self.decoders, self.optimizers, self.losses)):
+                    start = time.perf_counter()
+                    optimizer.zero_grad()
+                    with self.autocast():
+                        logits = decoder(features)
+                    loss = loss_fn(logits.float(), labels)
+                    loss.backward()
+                    optimizer.step()
+                    metrics[k].update(torch.sigmoid(logits.detach().float()), labels, loss)
+                    _sync()
+                    self.timings['decoders'][k] += time.perf_counter() - start
+
+            for config, m in zip(self.configs, metrics):
+                self.history[config['name']]['train'].append(m.compute())
+            if self.val_loader:
+                for config, results in zip(self.configs, self.validate()):
+                    self.history[config['name']]['val'].append(results)
+            self.print_epoch(epoch, epochs)
+
+        self.best = self.select_best()
+        return self.best
+
+    def validate(self):
+        self.decoders.eval()
+        metrics = [SegmentationMetrics() for _ in self.configs]
+        with torch.no_grad():
+            for inputs, labels in self.val_loader:
+                features, labels = self.features(inputs, labels, self.batch_transform)
+                for k, (decoder, loss_fn) in enumerate(zip(self.decoders, self.losses)):
+                    with self.autocast():
+                        logits = decoder(features).float()
+                    metrics[k].update(torch.sigmoid(logits), labels, loss_fn(logits, labels))
+        return [m.compute() for m in metrics]
+
+    def select_best(self):
+        """Name of the config with the highest final `selection_metric` (validation, else training)."""
+        split = 'val' if self.val_loader else 'train'
+        return max(self.configs, key=lambda c: self.history[c['name']][split][-1][self.selection_metric])['name']
+
+    def build_model(self, name=None):
+        """EncoderDecoder sharing the encoder with the decoder of config `name` (default: the best one)."""
+        name = name if name is not None else self.best
+        k = [c['name'] for c in self.configs].index(name)
+        return EncoderDecoder(self.encoder, self.decoders[k])
+
+    def print_epoch(self, epoch, epochs):
+        split = 'val' if self.val_loader else 'train'
+        print(f"Epoch {epoch + 1}/{epochs}")
+        print(f"{'Config':<40}{'Train loss':>12}{split.capitalize() + ' loss':>12}{split.capitalize() + ' IoU':>10}{split.capitalize() + ' Dice':>11}")
+        for config in self.configs:
+            train = self.history[config['name']]['train'][-1]
+            scores = self.history[config['name']][split][-1]
+            print(f"{config['name'][:39]:<40}{train['loss']:>12.4f}{scores['loss']:>12.4f}{scores['iou']:>10.4f}{scores['dice']:>11.4f}")
+
+    def report(self):
+        """Final ranking and the time saved against K separate runs that each repeat the encoder pass."""
+        split = 'val' if self.val_loader else 'train'
+        ranked = sorted(self.configs, key=lambda c: self.history[c['name']][split][-1][self.selection_metric], reverse=True)
+        print(f"{'Config':<40}{split.capitalize() + ' IoU':>10}{split.capitalize() + ' Dice':>11}{'Decoder s':>11}")
+        for config in ranked:
+            k = self.configs.index(config)
+            scores = self.history[config['name']][split][-1]
+            marker = "  <- best" if config['name'] == self.best else ""
+            print(f"{config['name'][:39]:<40}{scores['iou']:>10.4f}{scores['dice']:>11.4f}{self.timings['decoders'][k]:>11.1f}{marker}")
+
+        shared = self.timings['encoder'] + sum(self.timings['decoders'])
+        separate = len(self.configs) * self.timings['encoder'] + sum(self.timings['decoders'])
+        print(f"Training time {shared:.1f}s (encoder {self.timings['encoder']:.1f}s), "
+              f"estimated {separate:.1f}s for {len(self.configs)} separate runs: {separate / max(shared, 1e-9):.2f}x faster")
+        return {'best': self.best, 'shared_s': shared, 'estimated_separate_s': separate,
+                'ranking': [c['name'] for c in ranked]}
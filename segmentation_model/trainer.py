@@ -0,0 +1,495 @@
+"""Training loop for the encoder-decoder models."""
+
+import contextlib
+import copy
+import itertools
+import math
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.nn as nn
+import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
+
+from .checkpointing import capture_rng_state, restore_rng_state, to_cpu
+from .devices import device
+from .metrics import SegmentationMetrics
+from .profiling import NullProfiler
+from .training_control import TrainingControl
+from .tta import build_tta
+
+EXECUTION_MODES = {
+    'fp32': {},
+    'bf16': {'precision': 'bf16'},
+    'channels_last': {'channels_last': True},
+    'bf16+channels_last': {'precision': 'bf16', 'channels_last': True},
+    'compile': {'compile_model': True},
+    'bf16+channels_last+compile': {'precision': 'bf16', 'channels_last': True, 'compile_model': True}
+}
+
+def progressive_resolution(epochs, sizes=(64, 96, 128)):
+    """MobileNetTrainer resolution_schedule spending an equal share of `epochs` at each of `sizes`, in order."""
+    return [(i * epochs // len(sizes), size) for i, size in enumerate(sizes)]
+
+class MobileNetTrainer():
+    def __init__(self, model, train_loader, num_classes, val_loader=[], test_loader=[], lr=0.001, feature_cache=None, batch_transform=None, train_batch_transform=None,
+                 precision='fp32', channels_last=False, compile_model=False, distributed=False, checkpoint_manager=None, profiler=None,
+                 visualization_sink=None, control=None, accumulation_steps=1, activation_checkpointing=False,
+                 resolution_schedule=None, loader_factory=None, non_blocking=False):
+        if precision not in ('fp32', 'bf16'):
+            raise ValueError(f"Unsupported precision '{precision}', expected 'fp32' or 'bf16'")
+        if resolution_schedule is not None:
+            if loader_factory is None:
+                raise ValueError("resolution_schedule needs a loader_factory(size) returning the training loader at that size")
+            if feature_cache is not None:
+                raise ValueError("Cached encoder features have a fixed resolution; use either feature_cache or resolution_schedule")
+            odd_sizes = [size for _, size in resolution_schedule if size % 32]
+            if odd_sizes:
+                # The encoder downsamples by 32 and the decoder upsamples by 32
+                raise ValueError(f"Training sizes must be multiples of 32, got {odd_sizes}")
+
+        self.model = model
+        self.train_loader = train_loader
+        self.feature_cache = feature_cache
+        self.batch_transform = batch_transform
+        # Training batches may additionally be augmented; defaults to the evaluation transform
+        self.train_batch_transform = train_batch_transform if train_batch_transform is not None else batch_transform
+        self.test_loader = test_loader
+        self.val_loader = val_loader
+        # (start epoch, image size) steps; loader_factory(size) builds the training loader of each size once
+        self.resolution_schedule = sorted(resolution_schedule) if resolution_schedule is not None else None
+        self.loader_factory = loader_factory
+        self._resolution_loaders = {}
+        self.lr = lr
+        self.precision = precision
+        self.channels_last = channels_last
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        self.model = self.model.to(device)
+        # Trades recomputation for activation memory; see EncoderDecoder.set_activation_checkpointing
+        if activation_checkpointing:
+            self.model.set_activation_checkpointing(True)
+        # Gradients of this many batches are summed before each optimizer step
+        self.accumulation_steps = accumulation_steps
+        # Asynchronous host-to-device copies; they only overlap with compute from pinned loader memory
+        self.non_blocking = non_blocking
+
+        # Gradients are all-reduced across the process group; rank 0 prints, plots and checkpoints
+        self.distributed = distributed
+        self.rank = dist.get_rank() if distributed else 0
+        self.world_size = dist.get_world_size() if distributed else 1
+        self.is_main = self.rank == 0
+        self.checkpoint_manager = checkpoint_manager
+        self._resume_state = None
+        self.profiler = profiler if profiler is not None else NullProfiler()
+        self.visualization_sink = visualization_sink
+        # Defaults to validating after every epoch, without early stopping or LR schedule
+        self.control = control if control is not None else TrainingControl()
+        self.scheduler = None
+
+        self.forward_model = self.model
+        self.forward_decoder = self.model.decoder
+        self._ddp_module = None
+        if distributed:
+            # The ImageNet classifier never runs, and DDP rejects trainable parameters without gradients
+            self.model.mobilenet.classifier.requires_grad_(False)
+            self.forward_model = DistributedDataParallel(self.model)
+            self.forward_decoder = DistributedDataParallel(self.model.decoder)
+            self._ddp_module = self.forward_decoder if feature_cache is not None else self.forward_model
+        # Compiled/DDP wrappers share parameters with self.model, which stays the module of record
+        if compile_model:
+            self.forward_model = torch.compile(self.forward_model)
+            self.forward_decoder = torch.compile(self.forward_decoder)
+        self.criterion = nn.BCEWithLogitsLoss()  # Logit-based, so it is safe under autocast
+        self.optimizer = optim.Adam(model.parameters(), lr=self.lr)
+        self.training_losses = []
+        self.num_classes = num_classes
+        self.val_losses = []
+        self.metric_history = {'train': [], 'val': []}
+        self.throughput = []
+        self.l2_penalty = 1e-5
+
+    def train(self, epochs):
+        if self.is_main:
+            print(f"Training with {epochs} epochs\n")
+        train_loader = self.train_loader
+        if self.resolution_schedule is not None:
+            # Every size should share the batch size: the LR schedule is sized from this loader
+            train_loader = self.resolution_loader(0)
+        if self.feature_cache is not None:
+            # Decoder-only training: the frozen encoder has already been run once per image
+            train_loader = self.feature_cache.loader(batch_size=self.train_loader.batch_size, shuffle=True, distributed=self.distributed)
+
+        control = self.control
+        accumulate = self.accumulation_steps
+        num_batches = len(train_loader)
+        control.start(self.optimizer, epochs, math.ceil(num_batches / accumulate))
+        self.scheduler = control.scheduler
+        global_step = 0
+        first_epoch = 0
+        resume, self._resume_state = self._resume_state, None
+        if resume is not None:
+            first_epoch, global_step = resume['epoch'], resume['global_step']
+
+        for epoch in range(first_epoch, epochs):
+            vis = True
+            if self.resolution_schedule is not None:
+                train_loader = self.resolution_loader(epoch, announce=self.is_main)
+                num_batches = len(train_loader)
+            if hasattr(train_loader.sampler, 'set_epoch'):
+                train_loader.sampler.set_epoch(epoch)  # Reshuffle the DistributedSampler shards
+            self.set_train_mode()
+            metrics = SegmentationMetrics()
+            start = time.perf_counter()
+            val_time = 0.0
+            val_results = None
+
+            self.model = self.model.to(device)
+
+            profiler = self.profiler
+            step_in_epoch = 0
+            if resume is not None:
+                batches, epoch_rng, step_in_epoch = self.resume_epoch(train_loader, resume, metrics)
+                resume = None
+            else:
+                epoch_rng = torch.get_rng_state()  # Lets a mid-epoch checkpoint replay this epoch's shuffle
+                batches = train_loader
+            # Images trained before a mid-epoch checkpoint are not timed; rank 0 holds the count of all ranks
+            resumed_images = metrics.num_images
+
+            for inputs, labels in profiler.iterate(batches):
+                group_start = step_in_epoch - step_in_epoch % accumulate
+                group_size = min(accumulate, num_batches - group_start)  # The last group of an epoch may be short
+                last_in_group = step_in_epoch + 1 == group_start + group_size
+                if step_in_epoch == group_start:
+                    self.optimizer.zero_grad()
+
+                # DDP all-reduces the gradients only with the last micro-batch of a group
+                with self.gradient_sync(last_in_group):
+                    if self.feature_cache is not None:
+                        with profiler.stage('transfer'):
+                            inputs, labels = self.to_device(inputs, labels)
+                            inputs = self.to_memory_format(inputs)
+                        with profiler.stage('forward'), self.autocast():
+                            logits = self.forward_decoder(inputs)  # Forward pass on cached encoder features
+                    else:
+                        inputs, labels = self.prepare_batch(inputs, labels, self.train_batch_transform, profiler)
+                        with profiler.stage('forward'), self.autocast():
+                            logits = self.forward_model(inputs, return_logits=True)  # Forward pass
+
+                    with profiler.stage('forward'):
+                        loss = self.criterion(logits.float(), labels)
+
+                    with profiler.stage('backward'):
+                        (loss / group_size).backward()  # Backward pass
+                if last_in_group:
+                    with profiler.stage('optimizer'):
+                        self.optimizer.step()  # Update the weights
+                        control.after_step()
+
+                with profiler.stage('metrics'):
+                    outputs = torch.sigmoid(logits.detach().float())
+                    metrics.update(outputs, labels, loss)
+                profiler.step()
+
+                step_in_epoch += 1
+                if not last_in_group:
+                    continue
+                # Step-based validation and checkpoints count optimizer steps, not micro-batches
+                global_step += 1
+                if control.should_validate_step(global_step):
+                    val_start = time.perf_counter()
+                    val_results = self.run_validation(epoch, global_step)
+                    val_time += time.perf_counter() - val_start
+                    self.set_train_mode()
+                    if control.stop_requested:
+                        break
+                manager = self.checkpoint_manager
+                if manager is not None and manager.should_save_step(global_step) and step_in_epoch < num_batches:
+                    self.save_checkpoint(epoch, step_in_epoch, global_step, metrics, epoch_rng)
+
+            # Average training loss and accuracy for this epoch
+            if self.distributed:
+                metrics.all_reduce()
+            train_results = metrics.compute()
+            epoch_time = time.perf_counter() - start - val_time
+            self.throughput.append((train_results['num_images'] - resumed_images) / epoch_time)
+            train_results['samples_per_sec'] = self.throughput[-1]
+            avg_loss = train_results['loss']
+            # Save training loss for plotting
+            self.training_losses.append(avg_loss)
+            self.metric_history['train'].append(train_results)
+            control.after_epoch(epoch, epoch_time)
+
+            if not control.stop_requested and control.should_validate_epoch(epoch):
+                with profiler.stage('validation'):
+                    val_results = self.run_validation(epoch, global_step)
+            self.val_losses.append(val_results['val_loss'] if val_results is not None else float('nan'))
+
+            avg_iou = train_results['iou']
+            avg_dice = train_results['dice']
+
+            if self.is_main:
+                if val_results is not None:
+                    self.print_training_metrics(epoch, epochs, avg_loss, val_results['val_loss'], avg_iou, val_results['val_iou'], avg_dice, val_results['val_dice'])
+                else:
+                    self.print_training_metrics(epoch, epochs, avg_loss, float('nan'), avg_iou, float('nan'), avg_dice, float('nan'))
+                with profiler.stage('plotting'):
+                    self.on_epoch_plot_mask("Training", outputs, labels, epoch)
+                    if val_results is not None:
+                        self.on_epoch_plot_mask("Validation", val_results['outputs'], val_results['labels'], epoch)
+            if self.checkpoint_manager is not None and self.checkpoint_manager.should_save_epoch(epoch):
+                # Resumes at the start of the next epoch
+                self.save_checkpoint(epoch + 1, 0, global_step, val_dice=val_results['val_dice'] if val_results is not None else None)
+            profiler.epoch_end(epoch)
+
+            if control.stop_requested:
+                if self.is_main:
+                    print(f"Early stopping after epoch {epoch + 1}: val Dice has not improved for {control.early_stopping.patience} validations")
+                break
+
+        if self.checkpoint_manager is not None and self.is_main:
+            self.checkpoint_manager.wait()
+        if self.is_main:
+            self.training_report = control.report()
+
+    def resolution_at(self, epoch):
+        """Training image size of `epoch` under the resolution schedule; None before its first step."""
+        size = None
+        for start_epoch, step_size in self.resolution_schedule:
+            if epoch >= start_epoch:
+                size = step_size
+        return size
+
+    def resolution_loader(self, epoch, announce=False):
+        """
+        Training loader of `epoch` under the resolution schedule. Loaders are built once per size,
+        so their shards or caches are reused whenever the schedule returns to a size.
+        """
+        size = self.resolution_at(epoch)
+        if size is None:
+            return self.train_loader
+        if size not in self._resolution_loaders:
+            self._resolution_loaders[size] = self.loader_factory(size)
+        if announce and (epoch == 0 or self.resolution_at(epoch - 1) != size):
+            print(f"Epoch {epoch + 1}: training at {size}x{size}")
+        return self._resolution_loaders[size]
+
+    def set_train_mode(self):
+        self.model.train()  # Training Mode of torch model
+        if self.feature_cache is not None:
+            self.model.mobilenet.eval()  # Keep BN statistics identical to the cached features
+
+    def run_validation(self, epoch, step):
+        start = time.perf_counter()
+        val_results = self.validate()
+        val_results['metrics'].update(epoch=epoch, step=step)
+        self.metric_history['val'].append(val_results['metrics'])
+        self.control.on_validation(epoch, val_results['val_dice'], time.perf_counter() - start)
+        return val_results
+
+    def snapshot(self, epoch, step_in_epoch, global_step, metrics=None, epoch_rng=None):
+        """CPU copy of everything needed to continue training exactly from `step_in_epoch` of `epoch`."""
+        return to_cpu({
+            'epoch': epoch,
+            'step_in_epoch': step_in_epoch,
+            'global_step': global_step,
+            'model': self.model.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'control': self.control.state_dict(),
+            'metrics': metrics.state_dict() if metrics is not None else None,
+            'rng': capture_rng_state(),
+            'epoch_rng': epoch_rng,
+            'training_losses': self.training_losses,
+            'val_losses': self.val_losses,
+            'metric_history': {k: [dict(m) for m in v] for k, v in self.metric_history.items()},
+            'throughput': self.throughput
+        })
+
+    def save_checkpoint(self, epoch, step_in_epoch, global_step, metrics=None, epoch_rng=None, val_dice=None):
+        if metrics is not None and self.distributed:
+            # Collective: the checkpoint holds the totals of all ranks, which rank 0 restores on resume
+            metrics = copy.copy(metrics)
+            metrics.all_reduce()
+        # Only the device-to-host copy happens here; the checkpoint manager writes in the background
+        if self.is_main:
+            self.checkpoint_manager.save(self.snapshot(epoch, step_in_epoch, global_step, metrics, epoch_rng), metric=val_dice)
+
+    def resume(self, checkpoint):
+        """
+        Loads a checkpoint written by `save_checkpoint`; the next `train(epochs)` continues from it.
+
+        Args:
+            checkpoint (str or dict): Path to the checkpoint, or its loaded contents.
+        """
+        state = torch.load(checkpoint, map_location='cpu', weights_only=False) if isinstance(checkpoint, str) else checkpoint
+        self.model.load_state_dict(state['model'])
+        self.optimizer.load_state_dict(state['optimizer'])
+        self.control.load_state_dict(state['control'])
+        self.training_losses = list(state['training_losses'])
+        self.val_losses = list(state['val_losses'])
+        self.metric_history = {k: list(v) for k, v in state['metric_history'].items()}
+        self.throughput = list(state['throughput'])
+        self._resume_state = state
+
+    def resume_epoch(self, train_loader, state, metrics):
+        """Returns the remaining batches of the checkpointed epoch, its start RNG and the steps already taken."""
+        step_in_epoch = state['step_in_epoch']
+        if step_in_epoch == 0:
+            restore_rng_state(state['rng'])
+            return train_loader, torch.get_rng_state(), 0
+
+        # Replay the epoch's shuffle, then pick up the RNG streams where the checkpoint left them
+        torch.set_rng_state(state['epoch_rng'])
+        if hasattr(train_loader.sampler, 'set_start'):
+            train_loader.sampler.set_start(step_in_epoch * train_loader.batch_size)
+            batches = iter(train_loader)
+        else:
+            batches = iter(train_loader)
+            for _ in itertools.islice(batches, step_in_epoch):
+                pass
+        restore_rng_state(state['rng'])
+        if self.is_main:
+            # The checkpoint holds the totals of all ranks: rank 0 takes them over and the other ranks
+            # restart from zero, so the epoch-end all-reduce counts every image once
+            metrics.load_state_dict(state['metrics'], device=device)
+        return batches, state['epoch_rng'], step_in_epoch
+
+    def autocast(self):
+        if self.precision == 'bf16':
+            return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+
+    def to_memory_format(self, inputs):
+        if self.channels_last:
+            return inputs.contiguous(memory_format=torch.channels_last)
+        return inputs
+
+    def gradient_sync(self, sync):
+        """Context for a micro-batch's forward and backward; without `sync`, DDP skips the all-reduce."""
+        if self._ddp_module is None or sync:
+            return contextlib.nullcontext()
+        return self._ddp_module.no_sync()
+
+    def to_device(self, inputs, labels):
+        return inputs.to(device, non_blocking=self.non_blocking), labels.to(device, non_blocking=self.non_blocking)
+
+    def prepare_batch(self, inputs, labels, batch_transform=None, profiler=None):
+        batch_transform = batch_transform if batch_transform is not None else self.batch_transform
+        profiler = profiler if profiler is not None else NullProfiler()
+        with profiler.stage('transfer'):
+            inputs, labels = self.to_device(inputs, labels)
+        with profiler.stage('augment'):
+            if batch_transform is not None:
+                inputs, labels = batch_transform(inputs, labels)
+            inputs = self.to_memory_format(inputs)
+        return inputs, labels
+
+    def on_epoch_plot_mask(self, dataset, outputs, labels, epoch=0):
+        if self.visualization_sink is not None:
+            # Rendered and written to disk off the training thread
+            self.visualization_sink.submit(dataset, epoch, {'Prediction': outputs, 'Label': labels})
+            return
+
+        import matplotlib.pyplot as plt
+
+        output_np = outputs[0].detach().cpu().numpy().transpose(1, 2, 0)
+        label_np = labels[0].detach().cpu().numpy().transpose(1, 2, 0)
+
+        plt.figure(figsize=(7, 3))
+        combined_image = np.concatenate([output_np, label_np], axis=1)
+
+        plt.imshow(combined_image, vmin=0, vmax=1, cmap="gray")
+        plt.title(f"{dataset} - Prediction (Left) vs. Label (Right)")
+        plt.axis('off')
+        plt.show()
+
+    def calculate_dice_iou(self, predictions, ground_truths):
+        """Per-image soft IoU and Dice for a batch, as two tensors of shape (batch,)."""
+        ious, dices, _, _, _ = SegmentationMetrics(thresholds=()).batch_scores(predictions, ground_truths)
+        return ious[0], dices[0]
+
+    def run_eval_loop(self, loader, tta=None):
+        self.model.eval()  # Evaluation Mode
+        metrics = SegmentationMetrics()
+        model = build_tta(self.forward_model, tta)
+
+        with torch.no_grad():
+            for inputs, labels in loader:
+                inputs, labels = self.prepare_batch(inputs, labels)
+
+                with self.autocast():
+                    logits = model(inputs, return_logits=True)
+                loss = self.criterion(logits.float(), labels)
+                outputs = torch.sigmoid(logits.float())
+                metrics.update(outputs, labels, loss)
+
+        if self.distributed:
+            metrics.all_reduce()
+        return metrics.compute(), outputs, labels
+
+    def validate(self):
+        results, outputs, labels = self.run_eval_loop(self.val_loader)
+
+        return {
+            'val_iou': results['iou'],
+            'val_dice': results['dice'],
+            'val_loss': results['loss'],
+            'metrics': results,
+            'outputs': outputs,
+            'labels': labels
+        }
+
+    def evaluate(self, tta=None):
+        """Test loss, IoU and Dice; `tta` is a TTA_CONFIGS name or kwargs dict for batched test-time augmentation."""
+        results, _, _ = self.run_eval_loop(self.test_loader, tta)
+        self.test_metrics = results
+
+        return results['loss'], results['iou'], results['dice']
+
+    def plot_loss_curves(self):
+        import matplotlib.pyplot as plt
+
+        epochs = range(1, len(self.training_losses) + 1)
+
+        # Create a new figure
+        plt.figure(figsize=(8, 6))
+
+        # Plot Loss Curves
+        plt.plot(epochs, self.training_losses, label='Training Loss', color='tab:red')
+        plt.plot(epochs, self.val_losses, label='Validation Loss', linestyle='dashed', color='tab:orange')
+
+        # Customize the plot
+        plt.xlabel('Epoch', fontsize=12)
+        plt.ylabel('Loss', fontsize=12)
+        plt.title('Loss vs. Epoch', fontsize=14)
+        plt.legend(loc='upper right', fontsize=10)
+        plt.grid(True)
+
+        # Show plot
+        plt.tight_layout()
+        plt.show()
+
+    def print_training_metrics(self, epoch, epochs, avg_loss, val_loss, avg_iou, val_iou, avg_dice, val_dice):
+        """Prints training metrics with separator box."""
+
+        box_char = "-"
+        sep_length = 60
+
+        # Construct the separator box
+        separator = box_char * sep_length
+
+        # Format the training metrics using dedent for cleaner multi-line strings
+        metrics_text = f"""
+            Epoch {epoch + 1}/{epochs}
+            Training/Loss: {avg_loss:.4f}, Validation/Loss: {val_loss:.4f}
+            Training/IoU: {avg_iou:.4f}, Validation/IoU: {val_iou: .4f}
+            Training/Dice: {avg_dice:.4f}, Validation/Dice: {val_dice: .4f}
+        """
+
+        # Print the separator box, metrics, and another separator
+        print(separator)
+        print(metrics_text)
+        print(separator)
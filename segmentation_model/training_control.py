@@ -0,0 +1,158 @@
+"""Evaluation cadence, early stopping and learning-rate scheduling for MobileNetTrainer."""
+
+import torch.optim as optim
+
+def _one_cycle(optimizer, epochs, steps_per_epoch, max_lr=None, pct_start=0.3, **kwargs):
+    max_lr = max_lr if max_lr is not None else [group['lr'] for group in optimizer.param_groups]
+    return optim.lr_scheduler.OneCycleLR(optimizer, max_lr=max_lr, total_steps=epochs * steps_per_epoch, pct_start=pct_start, **kwargs), 'step'
+
+def _cosine(optimizer, epochs, steps_per_epoch, eta_min=0.0, **kwargs):
+    return optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=epochs * steps_per_epoch, eta_min=eta_min, **kwargs), 'step'
+
+def _step(optimizer, epochs, steps_per_epoch, step_size=10, gamma=0.1, **kwargs):
+    return optim.lr_scheduler.StepLR(optimizer, step_size=step_size, gamma=gamma, **kwargs), 'epoch'
+
+def _plateau(optimizer, epochs, steps_per_epoch, factor=0.5, patience=2, **kwargs):
+    return optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='max', factor=factor, patience=patience, **kwargs), 'plateau'
+
+# name -> factory(optimizer, epochs, steps_per_epoch, **kwargs) returning (scheduler, interval), where
+# interval is 'step', 'epoch' or 'plateau' (stepped with the val Dice after each validation)
+SCHEDULERS = {
+    'one_cycle': _one_cycle,
+    'cosine': _cosine,
+    'step': _step,
+    'plateau': _plateau
+}
+
+class EarlyStopping():
+    def __init__(self, patience=5, min_delta=0.0):
+        """Stops once val Dice has not improved by more than `min_delta` for `patience` validations."""
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best = None
+        self.bad_validations = 0
+
+    def update(self, value):
+        """Returns True if `value` is a new best."""
+        if self.best is None or value > self.best + self.min_delta:
+            self.best = value
+            self.bad_validations = 0
+            return True
+        self.bad_validations += 1
+        return False
+
+    @property
+    def should_stop(self):
+        return self.bad_validations >= self.patience
+
+class TrainingControl():
+    def __init__(self, val_every_epochs=1, val_every_steps=None, early_stopping_patience=None, min_delta=0.0,
+                 scheduler=None, scheduler_kwargs=None):
+        """
+        Args:
+            val_every_epochs (int): Validate after every n-th epoch; the last epoch is always validated.
+            val_every_steps (int, optional): Additionally validate every n optimizer steps.
+            early_stopping_patience (int, optional): Validations without a val Dice improvement
+                before training stops. None disables early stopping.
+            min_delta (float): Minimum val Dice gain that counts as an improvement.
+            scheduler (str or callable, optional): Key of SCHEDULERS, or a factory with the same signature.
+            scheduler_kwargs (dict, optional): Extra arguments for the scheduler factory.
+        """
+        self.val_every_epochs = val_every_epochs
+        self.val_every_steps = val_every_steps
+        self.early_stopping = EarlyStopping(early_stopping_patience, min_delta) if early_stopping_patience else None
+        self.scheduler_name = scheduler
+        self.scheduler_kwargs = scheduler_kwargs or {}
+        self.scheduler = None
+        self.interval = None
+        self.best_dice = None
+        self.best_epoch = None
+        self.stop_requested = False
+        self.epoch_times = []
+        self.validation_times = []
+        self.planned_epochs = 0
+        self._pending_scheduler_state = None
+
+    def start(self, optimizer, epochs, steps_per_epoch):
+        self.planned_epochs = epochs
+        if self.scheduler_name is not None and self.scheduler is None:
+            factory = SCHEDULERS[self.scheduler_name] if isinstance(self.scheduler_name, str) else self.scheduler_name
+            self.scheduler, self.interval = factory(optimizer, epochs, steps_per_epoch, **self.scheduler_kwargs)
+        if self._pending_scheduler_state is not None and self.scheduler is not None:
+            self.scheduler.load_state_dict(self._pending_scheduler_state)
+        self._pending_scheduler_state = None
+
+    def should_validate_epoch(self, epoch):
+        return (epoch + 1) % self.val_every_epochs == 0 or epoch == self.planned_epochs - 1
+
+    def should_validate_step(self, global_step):
+        return self.val_every_steps is not None and global_step % self.val_every_steps == 0
+
+    def after_step(self):
+        if self.interval == 'step':
+            self.scheduler.step()
+
+    def after_epoch(self, epoch, elapsed):
+        self.epoch_times.append(elapsed)
+        if self.interval == 'epoch':
+            self.scheduler.step()
+
+    def on_validation(self, epoch, val_dice, elapsed):
+        self.validation_times.append(elapsed)
+        if self.best_dice is None or val_dice > self.best_dice:
+            self.best_dice, self.best_epoch = val_dice, epoch
+        if self.interval == 'plateau':
+            self.scheduler.step(val_dice)
+        if self.early_stopping is not None:
+            self.early_stopping.update(val_dice)
+            self.stop_requested = self.early_stopping.should_stop
+
+    def state_dict(self):
+        return {
+            'scheduler': self.scheduler.state_dict() if self.scheduler is not None else None,
+            'early_stopping': vars(self.early_stopping).copy() if self.early_stopping is not None else None,
+            'best_dice': self.best_dice,
+            'best_epoch': self.best_epoch,
+            'stop_requested': self.stop_requested,
+            'epoch_times': list(self.epoch_times),
+            'validation_times': list(self.validation_times)
+        }
+
+    def load_state_dict(self, state):
+        """Restores progress from a checkpoint; the scheduler state is applied once `start()` has built it."""
+        self._pending_scheduler_state = state['scheduler']
+        if self.early_stopping is not None and state['early_stopping'] is not None:
+            vars(self.early_stopping).update(state['early_stopping'])
+        self.best_dice = state['best_dice']
+        self.best_epoch = state['best_epoch']
+        self.stop_requested = state['stop_requested']
+        self.epoch_times = list(state['epoch_times'])
+        self.validation_times = list(state['validation_times'])
+
+    def report(self):
+        """Estimates the time saved against validating after every one of the planned epochs."""
+        epochs_run = len(self.epoch_times)
+        mean_epoch = sum(self.epoch_times) / max(epochs_run, 1)
+        mean_validation = sum(self.validation_times) / max(len(self.validation_times), 1)
+
+        actual = sum(self.epoch_times) + sum(self.validation_times)
+        baseline = self.planned_epochs * (mean_epoch + mean_validation)
+        report = {
+            'epochs_run': epochs_run,
+            'planned_epochs': self.planned_epochs,
+            'validations': len(self.validation_times),
+            'stopped_early': self.stop_requested,
+            'best_val_dice': self.best_dice,
+            'best_epoch': self.best_epoch,
+            'wall_clock_s': actual,
+            'estimated_full_run_s': baseline,
+            'time_saved_s': max(baseline - actual, 0.0)
+        }
+
+        print(f"Ran {epochs_run}/{self.planned_epochs} epochs with {len(self.validation_times)} validations"
+              + (" (stopped early)" if self.stop_requested else ""))
+        if self.best_dice is not None:
+            print(f"Best val Dice {self.best_dice:.4f} at epoch {self.best_epoch + 1}")
+        print(f"Wall-clock {actual:.1f}s, estimated {baseline:.1f}s for the full schedule: "
+              f"saved {report['time_saved_s']:.1f}s ({report['time_saved_s'] / max(baseline, 1e-9):.0%})")
+        return report
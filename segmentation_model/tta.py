@@ -0,0 +1,78 @@
+"""Batched test-time augmentation.
+
+All views of a batch (flips, and zooms about the image centre) are resampled into one larger
+batch, run through the model in a single call, mapped back to the original frame and averaged
+on the device. Every view keeps the input size, so scales do not need separate forward passes.
+"""
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+_FLIPS = {'h': (-1.0, 1.0), 'v': (1.0, -1.0), 'hv': (-1.0, -1.0)}
+
+# name -> TestTimeAugmentation kwargs; the un-augmented view is always included
+TTA_CONFIGS = {
+    'none': {'flips': (), 'scales': (1.0,)},
+    'hflip': {'flips': ('h',), 'scales': (1.0,)},
+    'flips': {'flips': ('h', 'v', 'hv'), 'scales': (1.0,)},
+    'hflip+scales': {'flips': ('h',), 'scales': (0.75, 1.0, 1.25)},
+    'flips+scales': {'flips': ('h', 'v', 'hv'), 'scales': (0.75, 1.0, 1.25)}
+}
+
+class TestTimeAugmentation(nn.Module):
+    def __init__(self, model, flips=('h',), scales=(1.0,)):
+        """
+        Drop-in wrapper for EncoderDecoder returning the merged prediction over all views.
+
+        Args:
+            model (nn.Module): EncoderDecoder (or a DDP/compiled wrapper of one).
+            flips (tuple): Any of 'h', 'v' and 'hv', applied on top of the plain view at every scale.
+            scales (tuple): Zoom factors about the centre. Zooming in (> 1) crops the border, which
+                then only receives votes from the other views; zooming out pads by reflection.
+        """
+        super(TestTimeAugmentation, self).__init__()
+        self.model = model
+        self.flips = tuple(flips)
+        self.scales = tuple(scales)
+
+        # Per view: output -> input scaling of x and y, as used by affine_grid
+        factors = [(fx / s, fy / s) for s in self.scales for fx, fy in [(1.0, 1.0)] + [_FLIPS[f] for f in self.flips]]
+        self.register_buffer('factors', torch.tensor(factors), persistent=False)
+
+    @property
+    def num_views(self):
+        return len(self.factors)
+
+    def _warp(self, x, factors, padding_mode):
+        theta = torch.zeros(x.size(0), 2, 3, device=x.device, dtype=x.dtype)
+        theta[:, 0, 0], theta[:, 1, 1] = factors[:, 0], factors[:, 1]
+        grid = F.affine_grid(theta, list(x.shape), align_corners=False)
+        return F.grid_sample(x, grid, mode='bilinear', padding_mode=padding_mode, align_corners=False)
+
+    def forward(self, x, return_logits=False):
+        n, views = x.size(0), self.num_views
+        # View-major batch: rows [v * n, (v + 1) * n) hold view v of every image
+        factors = self.factors.to(x.device, torch.float32).repeat_interleave(n, dim=0)
+        batch = self._warp(x.float().repeat(views, 1, 1, 1), factors, 'reflection').to(x.dtype)
+        if x.is_contiguous(memory_format=torch.channels_last):
+            batch = batch.contiguous(memory_format=torch.channels_last)
+
+        probs = torch.sigmoid(self.model(batch, return_logits=True).float())
+
+        # Back to the input frame. Zero padding already scales every warped probability by its
+        # coverage, which the warped ones give as weights; pixels a zoomed-in view never saw get none
+        probs = self._warp(probs, 1.0 / factors, 'zeros')
+        weights = self._warp(torch.ones_like(probs[:, :1]), 1.0 / factors, 'zeros')
+        merged = probs.unflatten(0, (views, n)).sum(0) / weights.unflatten(0, (views, n)).sum(0).clamp_min(1e-6)
+
+        if return_logits:
+            return torch.logit(merged, eps=1e-6)
+        return merged
+
+def build_tta(model, tta):
+    """Wraps `model` for the TTA_CONFIGS name or kwargs dict `tta`; None and 'none' return it unchanged."""
+    if tta is None or tta == 'none':
+        return model
+    kwargs = TTA_CONFIGS[tta] if isinstance(tta, str) else tta
+    return TestTimeAugmentation(model, **kwargs)
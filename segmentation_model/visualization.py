@@ -0,0 +1,264 @@
+"""Matplotlib helpers for inspecting images, masks and predictions.
+
+matplotlib and OpenCV are imported inside the functions, so importing this module stays cheap.
+`VisualizationSink` renders prediction grids to PNG files on a background thread for headless runs.
+"""
+
+import os
+import queue
+import threading
+
+import torch
+
+from .data import normalize_batch
+from .devices import device
+from .manifest import DatasetManifest
+from .tta import build_tta
+
+def plot_image_with_mask(image, mask):
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, 3, figsize=(5, 6))
+
+    # Plot the original image
+    axes[0].imshow(image)
+    axes[0].set_title('Original Image')
+    axes[0].axis('off')
+
+    # Plot the mask
+    axes[1].imshow(mask, cmap="gray")
+    axes[1].set_title('Mask')
+    axes[1].axis('off')
+
+    # Plot the segmented mask
+    axes[2].imshow(image)
+    axes[2].imshow(mask, alpha=0.5, cmap='viridis')  # Overlay mask on the image
+    axes[2].set_title('Segmented Mask')
+    axes[2].axis('off')
+
+    plt.tight_layout()
+    plt.show()
+
+class ImageMaskVisualization():
+  def __init__(self, image_dir, mask_dir, manifest=None):
+    self.image_dir = image_dir
+    self.mask_dir = mask_dir
+    # Listed once; visualize() is a dictionary/list lookup
+    self.manifest = manifest if manifest is not None else DatasetManifest(image_dir, mask_dir)
+
+  def visualize(self, i):
+      """Plots sample `i`, given as a position or an image ID such as 'ISIC_0000000'."""
+      import cv2
+
+      record = self.manifest.manifest.get(i) if isinstance(i, str) else self.manifest[i]
+
+      image_path = os.path.join(self.image_dir, record['image'])
+      mask_path = os.path.join(self.mask_dir, record['mask'])
+
+      image = cv2.imread(image_path)
+      mask = cv2.imread(mask_path)
+
+      plot_image_with_mask(image, mask)
+
+def plot_mask(mask, label):
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, 2, figsize=(5, 6))
+
+    # Plot the original image
+    axes[0].imshow(label)
+    axes[0].set_title('Label Mask')
+    axes[0].axis('off')
+
+    # Plot the segmented mask
+    axes[1].imshow(mask)
+    axes[1].set_title('Predicted Mask')
+    axes[1].axis('off')
+
+    plt.tight_layout()
+    plt.show()
+
+def plot_masks(test_loader, model, num_images=10, sink=None, tta=None):
+    model.eval()
+    model = build_tta(model, tta)
+    with torch.no_grad():
+        for i, (images, labels) in enumerate(test_loader):
+            if i >= num_images:
+                break
+
+            images = images.to(device)
+            labels = labels.to(device)
+            images, labels = normalize_batch(images, labels)
+
+            outputs = model(images)
+            if sink is not None:
+                sink.submit("test_masks", i, {'Label Mask': labels, 'Generated Mask': outputs})
+                continue
+
+            import matplotlib.pyplot as plt
+
+            predicted_masks = outputs.squeeze(1).cpu().numpy()
+            label_masks = labels.squeeze(1).cpu().numpy()
+
+            for j in range(images.size(0)):
+                plt.figure(figsize=(5, 5))
+
+                plt.subplot(1, 2, 1)
+                plt.imshow(label_masks[j], cmap='gray')
+                plt.title('Label Mask')
+                plt.axis('off')
+
+                plt.subplot(1, 2, 2)
+                plt.imshow(predicted_masks[j], cmap='gray')
+                plt.title('Generated Mask')
+                plt.axis('off')
+
+                plt.show()
+                break
+
+def mask_gen_comparison(test_loader, model_ft, model, num_images=10, sink=None, tta=None):
+    model.eval()
+    model_ft.eval()
+    model, model_ft = build_tta(model, tta), build_tta(model_ft, tta)
+    with torch.no_grad():
+        for i, (images, labels) in enumerate(test_loader):
+            if i >= num_images:
+                break
+
+            images = images.to(device)
+            labels = labels.to(device)
+            images, labels = normalize_batch(images, labels)
+
+            outputs_ft = model_ft(images)
+            outputs = model(images)
+            if sink is not None:
+                sink.submit("task_comparison", i, {'Label Mask': labels, 'Task-2 Mask': outputs_ft, 'Task-1 Mask': outputs})
+                continue
+
+            import matplotlib.pyplot as plt
+
+            pred_ft = outputs_ft.squeeze(1).cpu().numpy()
+            pred = outputs.squeeze(1).cpu().numpy()
+
+            label_masks = labels.squeeze(1).cpu().numpy()
+
+            for j in range(images.size(0)):
+                plt.figure(figsize=(7, 6))
+
+
+                plt.subplot(1, 3, 1)
+                plt.imshow(label_masks[j], cmap='gray')
+                plt.title('Label Mask')
+                plt.axis('off')
+
+                plt.subplot(1, 3, 2)
+                plt.imshow(pred_ft[j], cmap='gray')
+                plt.title('Task-2 Mask')
+                plt.axis('off')
+
+                plt.subplot(1, 3, 3)
+                plt.imshow(pred[j], cmap='gray')
+                plt.title('Task-1 Mask')
+                plt.axis('off')
+
+                plt.show()
+                break
+
+class VisualizationSink():
+    def __init__(self, out_dir, num_samples=4, every_n=1, max_pending=8):
+        """
+        Renders prediction-vs-label grids to `<out_dir>/<tag>_<step>.png` on a background thread.
+
+        `submit` only copies a few detached samples to the CPU and enqueues them; when the
+        renderer falls behind, new grids are dropped instead of stalling the caller.
+
+        Args:
+            out_dir (str): Directory receiving the PNG files.
+            num_samples (int): Rows per grid, taken from the start of the batch.
+            every_n (int): Render only every n-th submission of each tag.
+            max_pending (int): Maximum number of grids waiting to be rendered.
+        """
+        self.out_dir = out_dir
+        self.num_samples = num_samples
+        self.every_n = every_n
+        self.dropped = 0
+        self._counts = {}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="visualization-sink", daemon=True)
+        os.makedirs(out_dir, exist_ok=True)
+        self._thread.start()
+
+    def submit(self, tag, step, panels):
+        """
+        Args:
+            tag (str): File name prefix, e.g. "Training".
+            step (int): Epoch or batch index used in the file name.
+            panels (dict): Column title -> (B, 1, H, W) or (B, H, W) tensor; columns keep this order.
+
+        Returns:
+            bool: Whether the grid was queued.
+        """
+        count = self._counts.get(tag, 0)
+        self._counts[tag] = count + 1
+        if count % self.every_n != 0:
+            return False
+
+        snapshot = {}
+        for title, tensor in panels.items():
+            tensor = tensor[:self.num_samples].detach().float()
+            snapshot[title] = tensor.reshape(tensor.size(0), *tensor.shape[-2:]).cpu().numpy()
+
+        try:
+            self._queue.put_nowait((tag, step, snapshot))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._render(*item)
+            except Exception as e:  # A failed render must not kill the sink
+                print(f"VisualizationSink: failed to render {item[0]} {item[1]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _render(self, tag, step, snapshot):
+        # The object-oriented API keeps rendering off pyplot's global state
+        from matplotlib.figure import Figure
+
+        titles = list(snapshot)
+        rows = len(snapshot[titles[0]])
+        fig = Figure(figsize=(2.5 * len(titles), 2.5 * rows))
+        axes = fig.subplots(rows, len(titles), squeeze=False)
+
+        for row in range(rows):
+            for col, title in enumerate(titles):
+                axes[row][col].imshow(snapshot[title][row], vmin=0, vmax=1, cmap="gray")
+                axes[row][col].axis('off')
+                if row == 0:
+                    axes[row][col].set_title(title)
+
+        fig.suptitle(f"{tag} - {step}")
+        fig.tight_layout()
+        fig.savefig(os.path.join(self.out_dir, f"{tag}_{step:05d}.png"))
+
+    def flush(self):
+        """Blocks until every queued grid has been written."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.dropped:
+            print(f"VisualizationSink: dropped {self.dropped} grids because rendering fell behind")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
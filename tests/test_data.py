@@ -0,0 +1,25 @@
+import torch
+
+from segmentation_model.data import PairedBatchAugment
+from segmentation_model.mask_codec import pack_masks
+
+def _batch(n=8, size=64):
+    images = torch.randint(0, 256, (n, 3, size, size), dtype=torch.uint8)
+    masks = torch.zeros(n, 1, size, size, dtype=torch.uint8)
+    masks[:, :, 16:40, 20:50] = 255
+    return images, masks
+
+def test_flip_path_keeps_image_and_mask_aligned():
+    images, masks = _batch()
+    masks[:, :, :, 0] = 255  # Marks the left edge
+    images[:, :, :, 0] = 0
+    out_images, out_masks = PairedBatchAugment(hflip_p=1.0, normalize=False)(images, pack_masks(masks))
+    assert torch.equal(out_masks[..., -1], torch.ones_like(out_masks[..., -1]))
+    assert torch.equal(out_images[..., -1], torch.zeros_like(out_images[..., -1]))
+
+def test_geometric_path_keeps_masks_binary():
+    torch.manual_seed(0)
+    images, masks = _batch()
+    augment = PairedBatchAugment(hflip_p=0.5, vflip_p=0.5, crop_scale=(0.5, 1.0), max_rotation=30.0)
+    _, out_masks = augment(images, masks)
+    assert set(out_masks.unique().tolist()) <= {0.0, 1.0}
@@ -0,0 +1,55 @@
+import json
+import socket
+
+import torch
+from PIL import Image
+
+from segmentation_model.distributed import distributed_train_worker, run_distributed
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _make_dataset(root):
+    image_dir, mask_dir = root / "images", root / "masks"
+    image_dir.mkdir()
+    mask_dir.mkdir()
+    for i in range(8):
+        Image.new('RGB', (40, 32), color=(i * 30, 80, 120)).save(image_dir / f"ISIC_{i:07d}.png")
+        Image.new('L', (40, 32), color=255 * (i % 2)).save(mask_dir / f"ISIC_{i:07d}_Segmentation.png")
+    return image_dir, mask_dir
+
+def test_two_process_training(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / "cache"))
+    monkeypatch.setenv('MASTER_PORT', str(_free_port()))
+    image_dir, mask_dir = _make_dataset(tmp_path)
+
+    results_path = tmp_path / "results.json"
+    run_distributed(distributed_train_worker, 2, {
+        'train_image_dir': str(image_dir), 'train_mask_dir': str(mask_dir), 'num_epochs': 1, 'learning_rate': 0.001,
+        'batch_size': 2, 'num_classes': 1, 'val_size': 0.25, 'pretrained_encoder': False,
+        'accumulation_steps': 2,
+        'results_path': str(results_path)
+    })
+
+    with open(results_path) as f:
+        results = json.load(f)
+    assert results['world_size'] == 2
+    assert len(results['metrics']['train']) == 1
+
+def test_mid_epoch_checkpoint_holds_all_ranks(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / "cache"))
+    monkeypatch.setenv('MASTER_PORT', str(_free_port()))
+    image_dir, mask_dir = _make_dataset(tmp_path)
+
+    checkpoint_dir = tmp_path / "checkpoints"
+    run_distributed(distributed_train_worker, 2, {
+        'train_image_dir': str(image_dir), 'train_mask_dir': str(mask_dir), 'num_epochs': 1, 'learning_rate': 0.001,
+        'batch_size': 1, 'num_classes': 1, 'val_size': 0.25, 'pretrained_encoder': False,
+        'checkpoint_dir': str(checkpoint_dir), 'checkpoint_every_steps': 1
+    })
+
+    state = torch.load(checkpoint_dir / "checkpoint_e000_s00000001.pt", weights_only=False)
+    assert state['step_in_epoch'] == 1
+    assert state['metrics']['num_images'] == 2  # One image from each rank
@@ -0,0 +1,34 @@
+import pytest
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from segmentation_model.evaluation import MultiModelEvaluator, parse_checkpoint_spec
+
+class _SizeRecorder(torch.nn.Module):
+    def __init__(self):
+        super(_SizeRecorder, self).__init__()
+        self.sizes = []
+
+    def forward(self, x):
+        self.sizes.append(x.shape[-1])
+        return torch.full_like(x[:, :1], 0.9)
+
+def test_models_run_at_their_input_size():
+    images = torch.randint(0, 256, (4, 3, 64, 64), dtype=torch.uint8)
+    masks = torch.full((4, 1, 64, 64), 255, dtype=torch.uint8)
+    loader = DataLoader(TensorDataset(images, masks), batch_size=2)
+    low, full = _SizeRecorder(), _SizeRecorder()
+
+    results = MultiModelEvaluator({'low': low, 'full': full}, input_sizes={'low': 32}).run(loader)
+
+    assert set(low.sizes) == {32} and set(full.sizes) == {64}
+    assert results['aggregate']['low']['dice'] == results['aggregate']['full']['dice']
+    assert len(results['per_image']) == 4
+
+def test_checkpoint_spec_carries_its_decoder(tmp_path):
+    path = str(tmp_path / "task2.pt")
+
+    assert parse_checkpoint_spec(f"task2={path}:dwsep-pixel_shuffle") == ('task2', path, 'dwsep-pixel_shuffle')
+    assert parse_checkpoint_spec(path, decoder='conv-bilinear') == ('task2.pt', path, 'conv-bilinear')
+    with pytest.raises(ValueError):
+        parse_checkpoint_spec(f"task2={path}:dwsep")
@@ -0,0 +1,17 @@
+import torch
+import torch.nn as nn
+
+from segmentation_model.export import fold_batchnorm
+from segmentation_model.models import ConfigurableDecoder, EncoderDecoder, build_encoder_decoder
+
+def test_fold_batchnorm_strips_all_dropout():
+    torch.manual_seed(0)
+    model = build_encoder_decoder(pretrained_encoder=False)
+    model = EncoderDecoder(model.mobilenet, ConfigurableDecoder(1280, 1, block='dwsep', upsample='pixel_shuffle', dropout=0.2)).eval()
+
+    folded = fold_batchnorm(model)
+
+    assert not any(isinstance(m, nn.modules.dropout._DropoutNd) for m in folded.modules())
+    inputs = torch.randn(2, 3, 64, 64)
+    with torch.no_grad():
+        assert torch.allclose(folded(inputs), model(inputs), atol=1e-4)
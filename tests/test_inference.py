@@ -0,0 +1,19 @@
+import pytest
+import torch
+
+from segmentation_model.inference import tiled_predict
+
+class _Constant(torch.nn.Module):
+    def forward(self, x):
+        return torch.full_like(x[:, :1], 0.25)
+
+def test_tiled_predict_keeps_image_size():
+    images = [torch.rand(3, 100, 150), torch.rand(3, 64, 64)]
+    maps = tiled_predict(_Constant(), images, tile=64, overlap=16)
+    assert [m.shape for m in maps] == [(100, 150), (64, 64)]
+    assert torch.allclose(maps[0], torch.full((100, 150), 0.25))
+
+@pytest.mark.parametrize('overlap', [64, 80, -1])
+def test_tiled_predict_rejects_invalid_overlap(overlap):
+    with pytest.raises(ValueError):
+        tiled_predict(_Constant(), [torch.rand(3, 64, 64)], tile=64, overlap=overlap)
@@ -0,0 +1,46 @@
+import os
+from collections import Counter
+from unittest import mock
+
+from PIL import Image
+
+from segmentation_model import manifest as manifest_module
+from segmentation_model.manifest import DatasetManifest
+
+def _make_dataset(root, sizes):
+    image_dir, mask_dir = root / "images", root / "masks"
+    image_dir.mkdir()
+    mask_dir.mkdir()
+    for i, size in enumerate(sizes):
+        Image.new('RGB', size).save(image_dir / f"ISIC_{i:07d}.png")
+        Image.new('L', size).save(mask_dir / f"ISIC_{i:07d}_Segmentation.png")
+    return str(image_dir), str(mask_dir)
+
+def test_reopen_does_not_rescan(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / "cache"))
+    image_dir, mask_dir = _make_dataset(tmp_path, [(8, 6)] * 3)
+    for path in (None, os.path.join(image_dir, ".manifest.json")):
+        DatasetManifest(image_dir, mask_dir, path=path)
+        with mock.patch.object(manifest_module, '_scan', wraps=manifest_module._scan) as scan:
+            for _ in range(3):
+                assert len(DatasetManifest(image_dir, mask_dir, path=path)) == 3
+        assert scan.call_count == 0
+
+def test_default_path_is_outside_the_data(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / "cache"))
+    image_dir, mask_dir = _make_dataset(tmp_path, [(8, 6)])
+    manifest = DatasetManifest(image_dir, mask_dir)
+    assert manifest.path.startswith(str(tmp_path / "cache"))
+    assert os.listdir(image_dir) == ["ISIC_0000000.png"]
+
+def test_stratified_split_fills_small_parts(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / "cache"))
+    # 200 records over 60 resolutions, most groups far too small to split on their own
+    sizes = [(8 + i % 60, 6) for i in range(200)]
+    image_dir, mask_dir = _make_dataset(tmp_path, sizes)
+    train, val = DatasetManifest(image_dir, mask_dir).stratified_split((0.9, 0.1))
+
+    assert (len(train), len(val)) == (180, 20)
+    assert not set(train.indices) & set(val.indices)
+    # The large part still covers every resolution
+    assert len(Counter((r['width'], r['height']) for r in train)) == 60
@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+import torch
+
+from segmentation_model.mask_codec import pack_masks, rle_decode, rle_encode, unpack_masks
+
+def test_pack_round_trip():
+    masks = (torch.rand(2, 1, 5, 13) > 0.5).to(torch.uint8) * 255
+    packed = pack_masks(masks)
+    assert packed.shape == (2, 1, 5, 2)
+    assert torch.equal(unpack_masks(packed, 13, torch.uint8) * 255, masks)
+
+def test_rle_round_trip():
+    mask = (torch.rand(7, 9) > 0.5).to(torch.uint8)
+    assert (rle_decode(rle_encode(mask)) == mask.numpy()).all()
+
+def test_mask_transform_repr_is_stable_across_processes():
+    # The feature cache fingerprint hashes this repr
+    code = "from segmentation_model.data import build_transform; print(repr(build_transform(64, packed_masks=True)['mask_transform']))"
+    reprs = {subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout for _ in range(2)}
+    assert len(reprs) == 1
@@ -0,0 +1,26 @@
+import torch
+
+from segmentation_model.models import build_encoder_decoder
+
+def _train_step(model, inputs, labels):
+    logits = model(inputs, return_logits=True)
+    torch.nn.functional.binary_cross_entropy_with_logits(logits, labels).backward()
+    return logits
+
+def test_activation_checkpointing_matches_plain_training():
+    torch.manual_seed(0)
+    for decoder in ('baseline', 'dwsep-pixel_shuffle'):
+        plain = build_encoder_decoder(pretrained_encoder=False, decoder=decoder).train()
+        checkpointed = build_encoder_decoder(pretrained_encoder=False, decoder=decoder).train()
+        checkpointed.load_state_dict(plain.state_dict())
+        checkpointed.set_activation_checkpointing(True)
+
+        inputs, labels = torch.randn(2, 3, 64, 64), (torch.rand(2, 1, 64, 64) > 0.5).float()
+        assert torch.allclose(_train_step(plain, inputs, labels), _train_step(checkpointed, inputs, labels), atol=1e-5)
+
+        # Recomputation in backward must not update the BatchNorm running statistics again
+        for (name, a), b in zip(plain.state_dict().items(), checkpointed.state_dict().values()):
+            assert torch.allclose(a.float(), b.float(), atol=1e-6), name
+        for a, b in zip(plain.parameters(), checkpointed.parameters()):
+            if a.grad is not None:
+                assert torch.allclose(a.grad, b.grad, atol=1e-4)
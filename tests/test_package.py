@@ -0,0 +1,7 @@
+import torch
+
+import segmentation_model
+import segmentation_model.trainer  # noqa: F401  Importing a submodule must not shadow lazy attributes
+
+def test_device_attribute_is_a_torch_device():
+    assert isinstance(segmentation_model.device, torch.device)
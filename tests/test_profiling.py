@@ -0,0 +1,33 @@
+import os
+
+from segmentation_model.profiling import StepProfiler
+
+def _run_steps(profiler, steps):
+    for _ in profiler.iterate(range(steps)):
+        with profiler.stage('forward'):
+            pass
+        profiler.step()
+
+def test_epoch_end_exports_open_trace_window(tmp_path):
+    profiler = StepProfiler(trace_dir=str(tmp_path), trace_steps=(1, 10))
+    _run_steps(profiler, 4)
+    profiler.epoch_end(0)
+
+    assert os.listdir(tmp_path) == ["trace_steps_1_4.json"]
+    assert profiler._torch_profiler is None
+
+def test_close_exports_open_trace_window(tmp_path):
+    profiler = StepProfiler(trace_dir=str(tmp_path), trace_steps=(0, 10))
+    _run_steps(profiler, 3)
+    profiler.close()
+
+    assert os.listdir(tmp_path) == ["trace_steps_0_3.json"]
+
+def test_summary_labels_memory_peak():
+    profiler = StepProfiler()
+    _run_steps(profiler, 2)
+    profiler.epoch_end(0)
+
+    summary = profiler.summary()
+    assert len({'peak_memory_mb', 'process_peak_memory_mb'} & summary.keys()) == 1
+    assert 'process_peak_memory_mb' not in summary['epoch_stages_ms']
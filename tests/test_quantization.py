@@ -0,0 +1,19 @@
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from segmentation_model.models import build_encoder_decoder
+from segmentation_model.quantization import _serialized_size, quantization_report, quantize_encoder_decoder, serving_graph
+
+def test_report_compares_the_same_graph():
+    torch.manual_seed(0)
+    model = build_encoder_decoder(pretrained_encoder=False).eval()
+    images = torch.randint(0, 256, (4, 3, 64, 64), dtype=torch.uint8)
+    masks = (torch.rand(4, 1, 64, 64) > 0.5).to(torch.uint8) * 255
+    loader = DataLoader(TensorDataset(images, masks), batch_size=2)
+
+    int8_model = quantize_encoder_decoder(model, loader, num_calibration_batches=1)
+    report = quantization_report(model, int8_model, loader, warmup=0)
+
+    # The ImageNet classifier is not part of the serving graph, so it must not count towards fp32
+    assert abs(report['fp32']['size_mb'] * 2 ** 20 - _serialized_size(serving_graph(model))) < 1
+    assert _serialized_size(serving_graph(model)) < _serialized_size(model)
@@ -0,0 +1,54 @@
+import matplotlib
+matplotlib.use('Agg')
+
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from segmentation_model.checkpointing import CheckpointManager
+from segmentation_model.data import normalize_batch
+from segmentation_model.models import build_encoder_decoder
+from segmentation_model.trainer import MobileNetTrainer
+from segmentation_model.training_control import TrainingControl
+
+def _loader(num_images=4, size=64, batch_size=2):
+    images = torch.randint(0, 256, (num_images, 3, size, size), dtype=torch.uint8)
+    masks = (torch.rand(num_images, 1, size, size) > 0.5).to(torch.uint8) * 255
+    return DataLoader(TensorDataset(images, masks), batch_size=batch_size)
+
+def test_train_one_epoch():
+    torch.manual_seed(0)
+    trainer = MobileNetTrainer(build_encoder_decoder(pretrained_encoder=False), _loader(), num_classes=1,
+                               val_loader=_loader(), batch_transform=normalize_batch)
+    trainer.train(1)
+
+    assert len(trainer.training_losses) == 1
+    assert len(trainer.metric_history['val']) == 1
+
+def test_train_progressive_resolution():
+    torch.manual_seed(0)
+    built = []
+    def loader_factory(size):
+        built.append(size)
+        return _loader(size=size)
+
+    trainer = MobileNetTrainer(build_encoder_decoder(pretrained_encoder=False), _loader(), num_classes=1,
+                               val_loader=_loader(), batch_transform=normalize_batch,
+                               resolution_schedule=[(0, 32), (1, 64)], loader_factory=loader_factory)
+    trainer.train(2)
+
+    assert built == [32, 64]
+    assert len(trainer.metric_history['val']) == 2
+
+def test_accumulation_counts_optimizer_steps(tmp_path):
+    torch.manual_seed(0)
+    manager = CheckpointManager(str(tmp_path), every_n_steps=1, keep_last=10)
+    control = TrainingControl(val_every_steps=1)
+    # 6 batches accumulated in pairs: 3 optimizer steps, the last one at the end of the epoch
+    trainer = MobileNetTrainer(build_encoder_decoder(pretrained_encoder=False), _loader(num_images=12), num_classes=1,
+                               val_loader=_loader(), batch_transform=normalize_batch, checkpoint_manager=manager,
+                               control=control, accumulation_steps=2)
+    trainer.train(1)
+    manager.close()
+
+    assert [m['step'] for m in trainer.metric_history['val']] == [1, 2, 3, 3]
+    assert sorted(e['global_step'] for e in manager.entries) == [1, 2, 3]
@@ -0,0 +1,14 @@
+import torch
+
+from segmentation_model import tta as tta_module
+
+class _Constant(torch.nn.Module):
+    def forward(self, x, return_logits=False):
+        return torch.logit(torch.full_like(x[:, :1], 0.3)) if return_logits else torch.full_like(x[:, :1], 0.3)
+
+def test_constant_prediction_is_unchanged_by_merging():
+    # A constant prediction must stay constant, including at the borders of zoomed views
+    tta = tta_module.TestTimeAugmentation(_Constant(), flips=('h', 'v'), scales=(0.75, 1.0, 1.25))
+    merged = tta(torch.rand(2, 3, 32, 32))
+    assert merged.shape == (2, 1, 32, 32)
+    assert torch.allclose(merged, torch.full_like(merged, 0.3), atol=1e-5)